@@ -0,0 +1,331 @@
+import io
+import json
+import time
+import random
+import asyncio
+import logging
+import sys
+import argparse
+from typing import Optional
+
+import tornado.web
+import tornado.netutil
+import tornado.httpserver
+from PIL import Image
+
+
+# Server giả lập Telegram Bot API và Gemini generateContent cho benchmark.
+# Chạy trong một tiến trình riêng (run_benchmark.py khởi động) để không tranh GIL và
+# event loop với bot đang được đo. Harness điều khiển qua /_bench/* trên cổng Telegram.
+
+FRUIT_LABELS = ["chuối", "táo", "cam", "xoài", "nho", "dưa hấu", "dứa", "dâu tây", "lê", "thanh long", "mít"]
+
+# (tên, rộng, cao) giống các PhotoSize Telegram tạo cho 1 ảnh
+PHOTO_SIZES = [("s", 90, 68), ("m", 320, 240), ("x", 800, 600), ("y", 1280, 960)]
+
+
+class LatencyModel:
+    """Độ trễ theo phân phối log-normal quanh median (ms); sigma=0 cho độ trễ cố định."""
+
+    def __init__(self, median_ms: float = 0.0, sigma: float = 0.0):
+        self.median_ms = median_ms
+        self.sigma = sigma
+
+    def sample(self) -> float:
+        if self.median_ms <= 0:
+            return 0.0
+        if self.sigma <= 0:
+            return self.median_ms / 1000
+        return random.lognormvariate(0, self.sigma) * self.median_ms / 1000
+
+
+def make_image(seed: int, width: int, height: int) -> bytes:
+    # Ảnh ô màu ngẫu nhiên theo seed: cùng seed -> cùng nội dung ở mọi kích thước
+    rng = random.Random(seed)
+    img = Image.new("RGB", (8, 6))
+    img.putdata([tuple(rng.randrange(256) for _ in range(3)) for _ in range(48)])
+    img = img.resize((width, height), Image.BILINEAR)
+    out = io.BytesIO()
+    img.save(out, format="JPEG", quality=85)
+    return out.getvalue()
+
+
+# === TELEGRAM ===
+class FakeTelegram:
+    def __init__(self, latency: LatencyModel, image_pool: int = 50):
+        self.latency = latency
+        self.image_pool = image_pool
+        self.updates: list = []
+        self.next_update_id = 1
+        self.next_message_id = 1000
+        self.new_update: Optional[asyncio.Event] = None
+        self.images: dict = {}
+        # message_id của tin nhắn trạng thái -> update_id gốc
+        self.status_messages: dict = {}
+        self.sent_at: dict = {}
+        self.replies: dict = {}
+        self.calls: dict = {}
+
+    def image_bytes(self, file_id: str) -> bytes:
+        data = self.images.get(file_id)
+        if data is None:
+            image_idx, size_name = file_id.rsplit("_", 1)
+            _name, width, height = next(size for size in PHOTO_SIZES if size[0] == size_name)
+            data = self.images[file_id] = make_image(int(image_idx[3:]), width, height)
+        return data
+
+    def prepare(self):
+        # Tạo sẵn ảnh trước khi đo để việc encode JPEG không tranh GIL với bot
+        for image_idx in range(self.image_pool):
+            for name, _width, _height in PHOTO_SIZES:
+                self.image_bytes(f"img{image_idx}_{name}")
+
+    def add_photo_update(self, user_id: int, image_idx: int) -> int:
+        update_id = self.next_update_id
+        self.next_update_id += 1
+        photo = [
+            {
+                "file_id": f"img{image_idx}_{name}",
+                "file_unique_id": f"u{image_idx}{name}",
+                "width": width,
+                "height": height,
+                "file_size": len(self.image_bytes(f"img{image_idx}_{name}")),
+            }
+            for name, width, height in PHOTO_SIZES
+        ]
+        self.updates.append({
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id,
+                "date": int(time.time()),
+                # Mỗi update một chat riêng để ghép câu trả lời với đúng update
+                "chat": {"id": 10 ** 9 + update_id, "type": "private"},
+                "from": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"},
+                "photo": photo,
+            },
+        })
+        self.sent_at[update_id] = time.perf_counter()
+        self.new_update.set()
+        return update_id
+
+    def message(self, chat_id: int, text: str, message_id: Optional[int] = None) -> dict:
+        if message_id is None:
+            message_id = self.next_message_id
+            self.next_message_id += 1
+        return {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": 1, "is_bot": True, "first_name": "bench"},
+            "text": text,
+        }
+
+    def record_reply(self, update_id: int, text: str):
+        if update_id not in self.replies:
+            self.replies[update_id] = (time.perf_counter() - self.sent_at[update_id], text)
+
+
+class TelegramApiHandler(tornado.web.RequestHandler):
+    def initialize(self, fake: FakeTelegram):
+        self.fake = fake
+
+    def params(self) -> dict:
+        params = {k: self.get_argument(k) for k in self.request.arguments}
+        if self.request.body and self.request.headers.get("Content-Type", "").startswith("application/json"):
+            params.update(json.loads(self.request.body))
+        return params
+
+    async def post(self, _token: str, method: str):
+        fake = self.fake
+        fake.calls[method] = fake.calls.get(method, 0) + 1
+        params = self.params()
+        delay = fake.latency.sample()
+        if method == "getUpdates":
+            offset = int(params.get("offset") or 0)
+            fake.updates = [u for u in fake.updates if u["update_id"] >= offset]
+            if not fake.updates:
+                fake.new_update.clear()
+                try:
+                    await asyncio.wait_for(fake.new_update.wait(), timeout=float(params.get("timeout") or 0) or 0.05)
+                except asyncio.TimeoutError:
+                    pass
+            return self.ok(list(fake.updates[:100]))
+        if delay:
+            await asyncio.sleep(delay)
+        if method == "getMe":
+            return self.ok({"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot",
+                            "can_join_groups": False, "can_read_all_group_messages": False,
+                            "supports_inline_queries": False})
+        if method == "getFile":
+            file_id = params["file_id"]
+            data = fake.image_bytes(file_id)
+            return self.ok({"file_id": file_id, "file_unique_id": file_id, "file_size": len(data),
+                            "file_path": f"photos/{file_id}.jpg"})
+        if method == "sendMessage":
+            chat_id = int(params["chat_id"])
+            message = fake.message(chat_id, params.get("text", ""))
+            update_id = chat_id - 10 ** 9
+            if params.get("text", "").startswith("🔍"):
+                fake.status_messages[message["message_id"]] = update_id
+            elif update_id in fake.sent_at:
+                fake.record_reply(update_id, params.get("text", ""))
+            return self.ok(message)
+        if method == "editMessageText":
+            message_id = int(params["message_id"])
+            update_id = fake.status_messages.get(message_id)
+            if update_id is not None:
+                fake.record_reply(update_id, params.get("text", ""))
+            return self.ok(fake.message(int(params["chat_id"]), params.get("text", ""), message_id))
+        return self.ok(True)
+
+    get = post
+
+    def ok(self, result):
+        self.set_header("Content-Type", "application/json")
+        self.finish(json.dumps({"ok": True, "result": result}, ensure_ascii=False))
+
+
+class TelegramFileHandler(tornado.web.RequestHandler):
+    def initialize(self, fake: FakeTelegram):
+        self.fake = fake
+
+    async def get(self, _token: str, file_id: str):
+        delay = self.fake.latency.sample()
+        if delay:
+            await asyncio.sleep(delay)
+        self.set_header("Content-Type", "image/jpeg")
+        self.finish(self.fake.image_bytes(file_id))
+
+
+# === GEMINI ===
+class FakeGemini:
+    def __init__(self, latency: LatencyModel, error_rate: float = 0.0, rate_429: float = 0.0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_429 = rate_429
+        self.requests = 0
+        self.images = 0
+        self.errors = 0
+        self.throttled = 0
+
+
+class GeminiHandler(tornado.web.RequestHandler):
+    def initialize(self, fake: FakeGemini):
+        self.fake = fake
+
+    async def post(self, _model: str):
+        fake = self.fake
+        fake.requests += 1
+        body = json.loads(self.request.body)
+        parts = body["contents"][0]["parts"]
+        images = sum(1 for part in parts if "inline_data" in part)
+        fake.images += images
+        await asyncio.sleep(fake.latency.sample())
+        roll = random.random()
+        if roll < fake.rate_429:
+            fake.throttled += 1
+            self.set_status(429)
+            self.set_header("Retry-After", "1")
+            return self.finish({"error": {"code": 429, "status": "RESOURCE_EXHAUSTED"}})
+        if roll < fake.rate_429 + fake.error_rate:
+            fake.errors += 1
+            self.set_status(503)
+            return self.finish({"error": {"code": 503, "status": "UNAVAILABLE"}})
+        labels = [random.choice(FRUIT_LABELS) for _ in range(images)]
+        batched = body.get("generationConfig", {}).get("responseMimeType") == "application/json"
+        text = json.dumps(labels, ensure_ascii=False) if batched else labels[0]
+        self.set_header("Content-Type", "application/json")
+        self.finish(json.dumps({
+            "candidates": [{"content": {"role": "model", "parts": [{"text": text}]}}],
+            "usageMetadata": {
+                "promptTokenCount": 60 + 258 * images,
+                "candidatesTokenCount": 4 * images,
+                "totalTokenCount": 60 + 262 * images,
+            },
+        }, ensure_ascii=False))
+
+
+# === CONTROL ===
+class ControlHandler(tornado.web.RequestHandler):
+    # POST /_bench/update {"user_id", "image_idx"} -> update_id
+    # GET /_bench/count -> số câu trả lời; GET /_bench/state -> toàn bộ kết quả
+    def initialize(self, telegram: FakeTelegram, gemini: FakeGemini):
+        self.telegram = telegram
+        self.gemini = gemini
+
+    def post(self, action: str):
+        if action != "update":
+            raise tornado.web.HTTPError(404)
+        params = json.loads(self.request.body)
+        self.finish({"update_id": self.telegram.add_photo_update(params["user_id"], params["image_idx"])})
+
+    def get(self, action: str):
+        if action == "count":
+            return self.finish({"replies": len(self.telegram.replies)})
+        if action != "state":
+            raise tornado.web.HTTPError(404)
+        telegram, gemini = self.telegram, self.gemini
+        self.set_header("Content-Type", "application/json")
+        self.finish(json.dumps({
+            "replies": {str(update_id): list(reply) for update_id, reply in telegram.replies.items()},
+            "telegram_calls": telegram.calls,
+            "gemini": {
+                "requests": gemini.requests,
+                "images": gemini.images,
+                "errors_injected": gemini.errors,
+                "throttled_injected": gemini.throttled,
+            },
+        }, ensure_ascii=False))
+
+
+# === RUNNER ===
+async def serve(telegram: FakeTelegram, gemini: FakeGemini, host: str = "127.0.0.1"):
+    # 429/503 cố ý tạo ra, không cần log từng request
+    logging.getLogger("tornado.access").setLevel(logging.ERROR)
+    telegram.new_update = asyncio.Event()
+    telegram_app = tornado.web.Application([
+        (r"/_bench/(\w+)", ControlHandler, {"telegram": telegram, "gemini": gemini}),
+        (r"/bot([^/]+)/(\w+)", TelegramApiHandler, {"fake": telegram}),
+        (r"/file/bot([^/]+)/photos/([^/]+)\.jpg", TelegramFileHandler, {"fake": telegram}),
+    ])
+    gemini_app = tornado.web.Application([
+        (r"/v1beta/models/([^/:]+):generateContent", GeminiHandler, {"fake": gemini}),
+    ])
+    telegram_sockets = tornado.netutil.bind_sockets(0, host)
+    gemini_sockets = tornado.netutil.bind_sockets(0, host)
+    tornado.httpserver.HTTPServer(telegram_app).add_sockets(telegram_sockets)
+    tornado.httpserver.HTTPServer(gemini_app).add_sockets(gemini_sockets)
+    # Dòng đầu tiên trên stdout: cổng cho tiến trình cha
+    print(json.dumps({
+        "telegram_port": telegram_sockets[0].getsockname()[1],
+        "gemini_port": gemini_sockets[0].getsockname()[1],
+    }), flush=True)
+    # Chạy tới khi tiến trình cha đóng stdin
+    await asyncio.get_running_loop().run_in_executor(None, sys.stdin.read)
+    # Trả lời nốt các getUpdates long-poll còn treo trước khi tắt loop
+    telegram.new_update.set()
+    await asyncio.sleep(0.1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Server Telegram/Gemini giả cho benchmark")
+    parser.add_argument("--image-pool", type=int, default=100)
+    parser.add_argument("--gemini-latency-ms", type=float, default=2000)
+    parser.add_argument("--gemini-sigma", type=float, default=0.5)
+    parser.add_argument("--gemini-error-rate", type=float, default=0.0)
+    parser.add_argument("--gemini-429-rate", type=float, default=0.0)
+    parser.add_argument("--telegram-latency-ms", type=float, default=30)
+    parser.add_argument("--telegram-sigma", type=float, default=0.3)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    telegram = FakeTelegram(LatencyModel(args.telegram_latency_ms, args.telegram_sigma), image_pool=args.image_pool)
+    telegram.prepare()
+    gemini = FakeGemini(LatencyModel(args.gemini_latency_ms, args.gemini_sigma),
+                        error_rate=args.gemini_error_rate, rate_429=args.gemini_429_rate)
+    asyncio.run(serve(telegram, gemini))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+
+import httpx
+
+# Benchmark end-to-end: chạy Application thật của bot trên server Telegram/Gemini giả,
+# bơm ảnh giả lập và đo độ trễ trả lời, throughput, RSS và độ trễ event loop.
+# Server giả (fake_servers.py) chạy ở tiến trình con nên không làm lệch số đo của bot;
+# độ trễ trả lời được đo bên server giả, từ lúc update xuất hiện tới lúc bot trả lời.
+#
+#   python benchmarks/run_benchmark.py --updates 500 --rate 50 --output bench.json
+#
+# Các biến môi trường của bot (CONCURRENT_UPDATES, GEMINI_BATCH_SIZE, USER_RATE_PER_MINUTE...)
+# vẫn được tôn trọng để so sánh cấu hình.
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def summarize(values: list) -> dict:
+    return {
+        "count": len(values),
+        "p50": percentile(values, 0.50),
+        "p95": percentile(values, 0.95),
+        "p99": percentile(values, 0.99),
+        "max": max(values) if values else 0.0,
+    }
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, timeout=5).stdout.strip()
+    except Exception:
+        return ""
+
+
+async def monitor_loop_lag(samples: list, stop: asyncio.Event, interval: float = 0.05):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        started = loop.time()
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, loop.time() - started - interval))
+
+
+def start_fake_servers(args) -> tuple:
+    command = [sys.executable, os.path.join(BENCH_DIR, "fake_servers.py"), "--seed", str(args.seed)]
+    for option in ("image_pool", "gemini_latency_ms", "gemini_sigma", "gemini_error_rate", "gemini_429_rate",
+                   "telegram_latency_ms", "telegram_sigma"):
+        command += [f"--{option.replace('_', '-')}", str(getattr(args, option))]
+    process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+    ports = json.loads(process.stdout.readline() or "null")
+    if not ports:
+        process.kill()
+        raise RuntimeError("Không khởi động được server giả")
+    return process, ports
+
+
+async def run(args, telegram_port: int) -> dict:
+    import metrics
+    import telegram_image_bot as bot
+
+    # Giống main(), nhưng không dùng run_polling để tự điều khiển vòng đời Application
+    metrics.enabled = bot.METRICS_ENABLED
+    metrics.setup_logging(json_logs=bot.LOG_FORMAT == "json", level=logging.WARNING)
+    bot.init_recognition_cache()
+    app = bot.build_application()
+    control = httpx.AsyncClient(base_url=f"http://127.0.0.1:{telegram_port}/_bench")
+    lag_samples: list = []
+    stop_monitor = asyncio.Event()
+
+    async with app, control:
+        await bot.post_init(app)
+        await bot.fruit_db.seed()
+        await bot.load_catalog_index()
+        await app.start()
+        await app.updater.start_polling(poll_interval=0, timeout=1, allowed_updates=["message"])
+        monitor = asyncio.create_task(monitor_loop_lag(lag_samples, stop_monitor))
+
+        rng = random.Random(args.seed)
+        started = time.perf_counter()
+        sent = 0
+        for i in range(args.updates):
+            user_id = 1000 + rng.randrange(args.users)
+            if i and rng.random() < args.duplicate_ratio:
+                image_idx = rng.randrange(min(i, args.image_pool))
+            else:
+                image_idx = i % args.image_pool if i >= args.image_pool else i
+            await control.post("/update", json={"user_id": user_id, "image_idx": image_idx})
+            sent += 1
+            if args.rate > 0:
+                await asyncio.sleep(rng.expovariate(args.rate))
+
+        deadline = time.perf_counter() + args.timeout
+        while time.perf_counter() < deadline:
+            if (await control.get("/count")).json()["replies"] >= sent:
+                break
+            await asyncio.sleep(0.1)
+        elapsed = time.perf_counter() - started
+
+        stop_monitor.set()
+        await monitor
+        state = (await control.get("/state")).json()
+        await app.updater.stop()
+        await app.stop()
+        await bot.post_shutdown(app)
+
+    replies = state["replies"]
+    latencies = [latency for latency, _text in replies.values()]
+    outcomes: dict = {}
+    for _latency, text in replies.values():
+        kind = "ok" if text.startswith(("🍉", "🙇")) else text.split(" ")[0]
+        outcomes[kind] = outcomes.get(kind, 0) + 1
+    return {
+        "updates_sent": sent,
+        "replies": len(replies),
+        "missing_replies": sent - len(replies),
+        "outcomes": outcomes,
+        "elapsed_seconds": elapsed,
+        "updates_per_second": len(replies) / elapsed if elapsed else 0.0,
+        "reply_latency_seconds": summarize(latencies),
+        "event_loop_lag_seconds": summarize(lag_samples),
+        # ru_maxrss trên Linux tính bằng KB; chỉ tiến trình bot, không gồm server giả
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "gemini": state["gemini"],
+        "telegram_calls": state["telegram_calls"],
+        "bot": {
+            "cache": bot.recognition_cache.stats(),
+            "scheduler": bot.recognition_scheduler.stats(),
+            "batcher": bot.gemini_batcher.stats() if bot.gemini_batcher else None,
+            "recognizer": dict(bot.recognizer_counters),
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark bot với server Telegram/Gemini giả")
+    parser.add_argument("--updates", type=int, default=200, help="Số ảnh gửi tới bot")
+    parser.add_argument("--rate", type=float, default=20, help="Số ảnh/giây (Poisson), 0 = gửi dồn một lần")
+    parser.add_argument("--users", type=int, default=50, help="Số người dùng giả lập")
+    parser.add_argument("--image-pool", type=int, default=100, help="Số ảnh khác nhau")
+    parser.add_argument("--duplicate-ratio", type=float, default=0.2, help="Tỉ lệ ảnh gửi lại (kiểm tra cache)")
+    parser.add_argument("--gemini-latency-ms", type=float, default=2000)
+    parser.add_argument("--gemini-sigma", type=float, default=0.5, help="Độ lệch log-normal của độ trễ Gemini")
+    parser.add_argument("--gemini-error-rate", type=float, default=0.0)
+    parser.add_argument("--gemini-429-rate", type=float, default=0.0)
+    parser.add_argument("--telegram-latency-ms", type=float, default=30)
+    parser.add_argument("--telegram-sigma", type=float, default=0.3)
+    parser.add_argument("--timeout", type=float, default=120, help="Thời gian tối đa chờ trả lời (giây)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default="bench_result.json")
+    args = parser.parse_args()
+
+    servers, ports = start_fake_servers(args)
+    telegram_port, gemini_port = ports["telegram_port"], ports["gemini_port"]
+
+    workdir = tempfile.mkdtemp(prefix="pmsshop-bench-")
+    # Cấu hình phải có trước khi import bot (đọc lúc import)
+    os.environ.update({
+        "TELEGRAM_BOT_TOKEN": "123456:bench",
+        "TELEGRAM_API_BASE_URL": f"http://127.0.0.1:{telegram_port}/bot",
+        "TELEGRAM_FILE_BASE_URL": f"http://127.0.0.1:{telegram_port}/file/bot",
+        "GEMINI_API_KEY": "bench",
+        "GEMINI_BASE_URL": f"http://127.0.0.1:{gemini_port}/v1beta",
+        "DB_PATH": os.path.join(workdir, "fruits.db"),
+        "CACHE_DB_PATH": os.path.join(workdir, "recognition_cache.db"),
+        "METRICS_PORT": "0",
+    })
+
+    try:
+        results = asyncio.run(run(args, telegram_port))
+    finally:
+        servers.stdin.close()
+        servers.wait(timeout=10)
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "config": vars(args),
+        "bot_env": {k: v for k, v in os.environ.items() if k.startswith((
+            "CONCURRENT_", "GEMINI_BATCH", "GEMINI_MAX", "GEMINI_RPM", "SCHED_", "USER_", "IMAGE_",
+            "LOCAL_CLASSIFIER", "CACHE_", "METRICS_ENABLED",
+        )) and k != "CACHE_DB_PATH"},
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    latency = results["reply_latency_seconds"]
+    lag = results["event_loop_lag_seconds"]
+    print(f"📨 {results['replies']}/{results['updates_sent']} trả lời trong {results['elapsed_seconds']:.1f}s "
+          f"({results['updates_per_second']:.1f} update/s) — {results['outcomes']}")
+    print(f"⏱️ Độ trễ trả lời p50/p95/p99: {latency['p50']:.3f} / {latency['p95']:.3f} / {latency['p99']:.3f} s")
+    print(f"🌀 Event loop lag p99/max: {lag['p99'] * 1000:.1f} / {lag['max'] * 1000:.1f} ms")
+    print(f"💾 Peak RSS: {results['peak_rss_mb']:.1f} MB | ☁️ Gemini: {results['gemini']['requests']} request "
+          f"cho {results['gemini']['images']} ảnh")
+    print(f"📝 Kết quả lưu tại {args.output}")
+
+
+if __name__ == "__main__":
+    main()
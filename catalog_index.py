@@ -0,0 +1,256 @@
+import re
+import unicodedata
+from typing import Iterable, Optional
+
+
+# Từ chỉ loại đứng trước tên trái cây ("quả chuối", "trái thanh long")
+CLASSIFIER_WORDS = ("quả", "trái", "qua", "trai")
+
+_NON_WORD = re.compile(r"[^\w\s]+")
+_SPACES = re.compile(r"\s+")
+
+
+def strip_diacritics(text: str) -> str:
+    decomposed = unicodedata.normalize("NFD", text)
+    stripped = "".join(ch for ch in decomposed if unicodedata.category(ch) != "Mn")
+    return unicodedata.normalize("NFC", stripped).replace("đ", "d").replace("Đ", "D")
+
+
+def normalize_name(text: str, fold_diacritics: bool = False) -> str:
+    text = unicodedata.normalize("NFC", text or "").casefold()
+    text = _SPACES.sub(" ", _NON_WORD.sub(" ", text).replace("_", " ")).strip()
+    if fold_diacritics:
+        text = strip_diacritics(text)
+    words = text.split(" ")
+    while len(words) > 1 and words[0] in CLASSIFIER_WORDS:
+        words = words[1:]
+    return " ".join(words)
+
+
+def _trigrams(text: str) -> set:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    # Levenshtein có cắt sớm: trả về limit + 1 khi chắc chắn vượt ngưỡng
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, start=1):
+        current = [i] + [0] * len(b)
+        for j, cb in enumerate(b, start=1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+class CatalogIndex:
+    """Chỉ mục sản phẩm trong bộ nhớ để tra tên trả về từ Gemini.
+
+    Thứ tự tra: tên chuẩn hoá -> bí danh -> bỏ dấu -> cụm từ con -> gần đúng (trigram + edit distance).
+    """
+
+    def __init__(self, fold_diacritics: bool = True, max_distance: int = 2):
+        self.fold_diacritics = fold_diacritics
+        self.max_distance = max_distance
+        self.clear()
+
+    def clear(self):
+        self._fruits = {}
+        self._names = {}
+        self._aliases = {}
+        # khoá tra -> tập id; nhiều id nghĩa là mơ hồ (vd "dua" sau khi bỏ dấu)
+        self._keys = {}
+        self._trigram_index = {}
+        # id -> khoá / bí danh của sản phẩm, để cập nhật từng sản phẩm không phải quét toàn bộ
+        self._fruit_keys = {}
+        self._fruit_aliases = {}
+
+    def __len__(self) -> int:
+        return len(self._fruits)
+
+    # --- build ---
+    def load(self, fruits: Iterable[tuple], aliases: Iterable[tuple] = ()):
+        self.clear()
+        for fruit_id, name, price, description in fruits:
+            self.upsert(fruit_id, name, price, description)
+        for alias, fruit_id in aliases:
+            self.add_alias(alias, fruit_id)
+
+    def _index_key(self, key: str, fruit_id: int):
+        if not key:
+            return
+        ids = self._keys.setdefault(key, set())
+        if not ids:
+            for gram in _trigrams(key):
+                self._trigram_index.setdefault(gram, set()).add(key)
+        ids.add(fruit_id)
+        self._fruit_keys.setdefault(fruit_id, set()).add(key)
+
+    def _unindex_fruit(self, fruit_id: int):
+        for key in self._fruit_keys.pop(fruit_id, ()):
+            ids = self._keys.get(key)
+            if ids is None:
+                continue
+            ids.discard(fruit_id)
+            if ids:
+                continue
+            del self._keys[key]
+            for gram in _trigrams(key):
+                bucket = self._trigram_index.get(gram)
+                if bucket:
+                    bucket.discard(key)
+                    if not bucket:
+                        del self._trigram_index[gram]
+
+    def _keys_for(self, text: str) -> list:
+        keys = [normalize_name(text)]
+        if self.fold_diacritics:
+            keys.append(normalize_name(text, fold_diacritics=True))
+        return keys
+
+    def _query_keys(self, text: str) -> list:
+        # Chỉ so khớp bỏ dấu khi chính câu hỏi không có dấu: "dừa" không được thành "dứa"
+        key = normalize_name(text)
+        if self.fold_diacritics and key == strip_diacritics(key):
+            return self._keys_for(text)
+        return [key]
+
+    def _resolve(self, key: str) -> Optional[int]:
+        ids = self._keys.get(key)
+        if ids and len(ids) == 1:
+            return next(iter(ids))
+        return None
+
+    def upsert(self, fruit_id: int, name: str, price, description):
+        old = self._fruits.get(fruit_id)
+        if old is not None and old["name"] == name:
+            # Chỉ đổi giá/mô tả: khoá tra không đổi, không cần index lại
+            old["price"], old["description"] = price, description
+            return
+        if old is not None:
+            self._names.pop(normalize_name(old["name"]), None)
+        self._fruits[fruit_id] = {"id": fruit_id, "name": name, "price": price, "description": description}
+        self._names[normalize_name(name)] = fruit_id
+        self._reindex(fruit_id)
+
+    def _reindex(self, fruit_id: int):
+        # Dựng lại toàn bộ khoá của một sản phẩm từ tên và các bí danh hiện có
+        self._unindex_fruit(fruit_id)
+        for text in (self._fruits[fruit_id]["name"], *self._fruit_aliases.get(fruit_id, ())):
+            for key in self._keys_for(text):
+                self._index_key(key, fruit_id)
+
+    def remove(self, fruit_id: int):
+        fruit = self._fruits.pop(fruit_id, None)
+        if fruit is None:
+            return
+        self._names.pop(normalize_name(fruit["name"]), None)
+        for alias in self._fruit_aliases.pop(fruit_id, ()):
+            if self._aliases.get(alias) == fruit_id:
+                del self._aliases[alias]
+        self._unindex_fruit(fruit_id)
+
+    def add_alias(self, alias: str, fruit_id: int):
+        if fruit_id not in self._fruits:
+            return
+        alias = normalize_name(alias)
+        previous = self._aliases.get(alias)
+        if previous is not None and previous != fruit_id:
+            # Bí danh chuyển sang sản phẩm khác: dựng lại khoá của sản phẩm cũ
+            self._fruit_aliases[previous].discard(alias)
+            self._reindex(previous)
+        self._aliases[alias] = fruit_id
+        self._fruit_aliases.setdefault(fruit_id, set()).add(alias)
+        for key in self._keys_for(alias):
+            self._index_key(key, fruit_id)
+
+    # --- lookup ---
+    def get(self, fruit_id: int) -> Optional[dict]:
+        fruit = self._fruits.get(fruit_id)
+        return dict(fruit) if fruit is not None else None
+
+    def find_id(self, name: str) -> Optional[int]:
+        return self._names.get(normalize_name(name))
+
+    def find_exact_id(self, name: str) -> Optional[int]:
+        # Chỉ tên hoặc bí danh khớp nguyên văn (sau chuẩn hoá), không bỏ dấu hay đoán gần đúng
+        key = normalize_name(name)
+        fruit_id = self._names.get(key)
+        return fruit_id if fruit_id is not None else self._aliases.get(key)
+
+    def _exact(self, text: str) -> Optional[int]:
+        fruit_id = self.find_exact_id(text)
+        if fruit_id is None:
+            for key in self._query_keys(text):
+                fruit_id = self._resolve(key)
+                if fruit_id is not None:
+                    break
+        return fruit_id
+
+    def _subphrase(self, text: str) -> Optional[int]:
+        # "qua chuoi chin": thử các cụm từ con, dài trước. Bỏ qua khi câu có dấu vì
+        # cụm từ con thường là loại khác ("táo tàu" không phải táo, "cam sành" không phải cam)
+        words = normalize_name(text)
+        if words != strip_diacritics(words):
+            return None
+        words = words.split(" ")
+        for size in range(len(words) - 1, 0, -1):
+            for start in range(len(words) - size + 1):
+                fruit_id = self._exact(" ".join(words[start:start + size]))
+                if fruit_id is not None:
+                    return fruit_id
+        return None
+
+    def _word_distance(self, query: str, key: str, limit: int) -> int:
+        # So từng từ: từ ngắn (<= 3 ký tự) phải khớp hẳn vì đổi một chữ là thành từ khác
+        # ("cau" / "cam", "tam" / "tay"); chỉ từ dài mới được lệch, gõ sai trong một từ
+        query_words, key_words = query.split(" "), key.split(" ")
+        if len(query_words) != len(key_words):
+            return limit + 1
+        total = 0
+        for a, b in zip(query_words, key_words):
+            if a == b:
+                continue
+            if min(len(a), len(b)) <= 3:
+                return limit + 1
+            total += edit_distance(a, b, 1 if len(a) <= 4 else limit)
+            if total > limit:
+                return limit + 1
+        return total
+
+    def _fuzzy(self, text: str) -> Optional[int]:
+        # Chỉ đoán gần đúng cho câu không dấu (lỗi gõ); câu có dấu lệch một từ là trái khác
+        # ("dâu tằm" không phải "dâu tây"), giống _subphrase
+        if self.max_distance <= 0:
+            return None
+        query = normalize_name(text)
+        if query != strip_diacritics(query):
+            return None
+        query = self._query_keys(text)[-1]
+        limit = self.max_distance
+        candidates = set()
+        for gram in _trigrams(query):
+            candidates.update(self._trigram_index.get(gram, ()))
+        best_id, best_distance = None, limit + 1
+        for key in candidates:
+            distance = self._word_distance(query, key, limit)
+            fruit_id = self._resolve(key)
+            if distance < best_distance:
+                best_id, best_distance = fruit_id, distance
+            elif distance == best_distance and fruit_id != best_id:
+                best_id = None  # mơ hồ giữa 2 sản phẩm -> không đoán
+        return best_id if best_distance <= limit else None
+
+    def lookup(self, name: str) -> Optional[dict]:
+        if not name:
+            return None
+        fruit_id = self._exact(name)
+        if fruit_id is None:
+            fruit_id = self._subphrase(name)
+        if fruit_id is None:
+            fruit_id = self._fuzzy(name)
+        return dict(self._fruits[fruit_id]) if fruit_id is not None else None
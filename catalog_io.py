@@ -0,0 +1,128 @@
+import io
+import csv
+import json
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from catalog_index import normalize_name
+
+
+# Nhập/xuất catalog dạng CSV hoặc JSON (mảng object hoặc JSON Lines).
+# Cột: name, price, description, aliases (bí danh cách nhau bằng "|").
+
+FIELDS = ("name", "price", "description", "aliases")
+FORMATS = {".csv": "csv", ".json": "json", ".jsonl": "jsonl", ".ndjson": "jsonl"}
+
+MAX_NAME_LENGTH = 100
+MAX_DESCRIPTION_LENGTH = 1000
+
+
+def detect_format(filename: str, mime_type: Optional[str] = None) -> Optional[str]:
+    name = (filename or "").lower()
+    for extension, fmt in FORMATS.items():
+        if name.endswith(extension):
+            return fmt
+    if mime_type in ("text/csv", "text/comma-separated-values"):
+        return "csv"
+    if mime_type == "application/json":
+        return "json"
+    return None
+
+
+def _iter_records(data: bytes, fmt: str) -> Iterator[Tuple[int, object]]:
+    # (số dòng, bản ghi thô) — CSV và JSON Lines đọc lần lượt từng dòng
+    text = io.TextIOWrapper(io.BytesIO(data), encoding="utf-8-sig", newline="")
+    if fmt == "csv":
+        reader = csv.DictReader(text)
+        for record in reader:
+            yield reader.line_num, record
+    elif fmt == "jsonl":
+        for line_no, line in enumerate(text, start=1):
+            if line.strip():
+                try:
+                    yield line_no, json.loads(line)
+                except json.JSONDecodeError as e:
+                    yield line_no, ValueError(f"JSON không hợp lệ: {e.msg}")
+    else:
+        records = json.load(text)
+        if isinstance(records, dict):
+            records = records.get("fruits")
+        if not isinstance(records, list):
+            raise ValueError("file JSON phải là mảng sản phẩm")
+        yield from enumerate(records, start=1)
+
+
+def _validate(record) -> dict:
+    if isinstance(record, Exception):
+        raise record
+    if not isinstance(record, dict):
+        raise ValueError("bản ghi phải là object")
+    name = str(record.get("name") or "").strip()
+    price = str(record.get("price") or "").strip()
+    description = record.get("description")
+    description = str(description).strip() if description not in (None, "") else None
+    aliases = record.get("aliases") or []
+    if isinstance(aliases, str):
+        aliases = aliases.split("|")
+    elif not isinstance(aliases, list):
+        raise ValueError("aliases phải là chuỗi hoặc danh sách")
+    if not name:
+        raise ValueError("thiếu tên")
+    if len(name) > MAX_NAME_LENGTH:
+        raise ValueError(f"tên dài quá {MAX_NAME_LENGTH} ký tự")
+    # Giá dạng chữ ("liên hệ") vẫn nhận, chỉ không sắp xếp được theo giá
+    if not price:
+        raise ValueError("thiếu giá")
+    if len(price) > MAX_NAME_LENGTH:
+        raise ValueError(f"giá dài quá {MAX_NAME_LENGTH} ký tự")
+    if description and len(description) > MAX_DESCRIPTION_LENGTH:
+        raise ValueError(f"mô tả dài quá {MAX_DESCRIPTION_LENGTH} ký tự")
+    return {
+        "name": name,
+        "price": price,
+        "description": description,
+        "aliases": [alias for alias in (normalize_name(str(a)) for a in aliases) if alias],
+    }
+
+
+def parse_catalog(data: bytes, fmt: str) -> Tuple[List[dict], List[str]]:
+    """Đọc và kiểm tra file catalog; trả về (các dòng hợp lệ, danh sách lỗi theo dòng).
+
+    Tên trùng nhau trong cùng file (sau chuẩn hoá) bị báo lỗi thay vì ghi đè lặng lẽ.
+    Lỗi đọc cả file (mã hoá, CSV/JSON hỏng giữa chừng) trả về không dòng nào, để không
+    nhập một phần đầu file bị cắt cụt.
+    """
+    rows, errors, seen = [], [], {}
+    try:
+        for line_no, record in _iter_records(data, fmt):
+            try:
+                row = _validate(record)
+            except ValueError as e:
+                errors.append(f"dòng {line_no}: {e}")
+                continue
+            key = normalize_name(row["name"])
+            if key in seen:
+                errors.append(f"dòng {line_no}: trùng tên với dòng {seen[key]}")
+                continue
+            seen[key] = line_no
+            rows.append(row)
+    except (UnicodeDecodeError, csv.Error, json.JSONDecodeError, ValueError) as e:
+        return [], errors + [f"không đọc được file, chưa nhập dòng nào: {e}"]
+    return rows, errors
+
+
+def write_csv(records: Iterable[tuple]) -> bytes:
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(FIELDS)
+    writer.writerows((name, price, description or "", aliases or "") for name, price, description, aliases in records)
+    # BOM để Excel nhận đúng UTF-8
+    return out.getvalue().encode("utf-8-sig")
+
+
+def write_json(records: Iterable[tuple]) -> bytes:
+    fruits = [
+        {"name": name, "price": price, "description": description or "",
+         "aliases": aliases.split("|") if aliases else []}
+        for name, price, description, aliases in records
+    ]
+    return json.dumps(fruits, ensure_ascii=False, indent=2).encode("utf-8")
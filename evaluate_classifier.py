@@ -0,0 +1,96 @@
+import os
+import time
+import asyncio
+import argparse
+
+from catalog_index import CatalogIndex
+from fruit_db import FruitDB
+from local_classifier import LocalClassifier, extract_features
+
+# Đánh giá bộ phân loại CPU trên thư mục ảnh giữ lại (held-out):
+#   <thư mục>/<tên trái cây>/*.jpg
+# Ảnh tham chiếu lấy từ bảng fruit_references trong fruits.db.
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp"}
+
+
+def iter_images(folder: str):
+    for label in sorted(os.listdir(folder)):
+        label_dir = os.path.join(folder, label)
+        if not os.path.isdir(label_dir):
+            continue
+        for filename in sorted(os.listdir(label_dir)):
+            if os.path.splitext(filename)[1].lower() in IMAGE_EXTENSIONS:
+                yield label, os.path.join(label_dir, filename)
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def load(db_path: str):
+    db = FruitDB(db_path)
+    try:
+        await db.migrate()
+        fruits = await db.list_fruits()
+        aliases = await db.list_aliases()
+        references = await db.list_references()
+    finally:
+        db.close()
+    return fruits, aliases, references
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Đánh giá độ chính xác và độ trễ của bộ phân loại CPU")
+    parser.add_argument("folder", help="Thư mục ảnh, mỗi thư mục con là tên một loại trái cây")
+    parser.add_argument("--db", default="fruits.db")
+    parser.add_argument("--k", type=int, default=int(os.getenv("LOCAL_CLASSIFIER_K", "5")))
+    parser.add_argument("--min-vote", type=float, default=float(os.getenv("LOCAL_CLASSIFIER_MIN_VOTE", "0.8")))
+    parser.add_argument("--min-similarity", type=float,
+                        default=float(os.getenv("LOCAL_CLASSIFIER_MIN_SIMILARITY", "0.9")))
+    args = parser.parse_args()
+
+    fruits, aliases, references = asyncio.run(load(args.db))
+    catalog = CatalogIndex()
+    catalog.load(fruits, aliases)
+    classifier = LocalClassifier(k=args.k, min_vote=args.min_vote, min_similarity=args.min_similarity)
+    classifier.load(references)
+    print(f"📚 {len(references)} ảnh tham chiếu, {len(catalog)} sản phẩm")
+
+    total = answered = correct = unreadable = unknown_label = 0
+    latencies = []
+    for label, path in iter_images(args.folder):
+        expected = catalog.lookup(label)
+        if expected is None:
+            unknown_label += 1
+            continue
+        with open(path, "rb") as f:
+            data = f.read()
+        started = time.perf_counter()
+        features = extract_features(data)
+        fruit_id = None
+        if features is not None:
+            fruit_id, _confidence = classifier.classify(features)
+        latencies.append(time.perf_counter() - started)
+        total += 1
+        if features is None:
+            unreadable += 1
+        elif fruit_id is not None:
+            answered += 1
+            correct += fruit_id == expected["id"]
+
+    if not total:
+        print("⚠️ Không có ảnh nào khớp sản phẩm trong catalog.")
+        return
+    print(f"🖼️ Ảnh đánh giá: {total} (bỏ qua {unknown_label} ảnh ngoài catalog, {unreadable} ảnh lỗi)")
+    print(f"💻 Tự trả lời (không cần Gemini): {answered}/{total} = {answered / total:.1%}")
+    print(f"🎯 Độ chính xác khi tự trả lời: {correct / answered:.1%}" if answered else "🎯 Độ chính xác: n/a")
+    print(f"⏱️ Độ trễ p50/p95/max: {percentile(latencies, 0.5) * 1000:.1f} / "
+          f"{percentile(latencies, 0.95) * 1000:.1f} / {max(latencies) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
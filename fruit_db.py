@@ -0,0 +1,449 @@
+import re
+import time
+import asyncio
+import logging
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, List, Optional, Tuple
+
+from catalog_index import normalize_name
+
+logger = logging.getLogger(__name__)
+
+# Dữ liệu mẫu 10 loại trái cây (trước đây nằm trong create_fruit_db.py)
+DEFAULT_FRUITS = [
+    ("chuối", "25.000đ/kg", "Chuối chín vàng, vị ngọt tự nhiên, giàu kali và vitamin B6, tốt cho tim mạch."),
+    ("táo", "45.000đ/kg", "Táo đỏ tươi, giòn ngọt, chứa nhiều chất chống oxy hóa, giúp đẹp da và hỗ trợ tiêu hóa."),
+    ("cam", "35.000đ/kg", "Cam mọng nước, giàu vitamin C, giúp tăng cường miễn dịch và làm đẹp da."),
+    ("xoài", "40.000đ/kg", "Xoài chín vàng, thơm ngọt, chứa nhiều vitamin A và C, tốt cho thị lực."),
+    ("nho", "60.000đ/kg", "Nho tươi ngon, nhiều dưỡng chất, giúp giảm căng thẳng và tốt cho tim mạch."),
+    ("dưa hấu", "20.000đ/kg", "Dưa hấu ngọt mát, chứa nhiều nước, giúp giải nhiệt và hỗ trợ tiêu hóa."),
+    ("dứa", "30.000đ/kg", "Dứa (thơm) có vị chua ngọt, chứa enzyme hỗ trợ tiêu hóa và làm đẹp da."),
+    ("dâu tây", "120.000đ/kg", "Dâu tây đỏ mọng, giàu vitamin C và chất chống oxy hóa, giúp làm đẹp và tốt cho da."),
+    ("lê", "50.000đ/kg", "Lê ngọt mát, nhiều nước, giúp thanh lọc cơ thể và tốt cho phổi."),
+    ("thanh long", "25.000đ/kg", "Thanh long tươi mát, ít calo, nhiều chất xơ, giúp hỗ trợ tiêu hóa và giảm cân."),
+]
+
+# Số có thể kèm đơn vị: "25.000đ", "1,5k", "2,5 nghìn", "1.2tr". Chỉ . và , là phân cách,
+# khoảng trắng thì không ("Combo 3 100k" không phải 3100k).
+_PRICE_TOKEN = re.compile(
+    r"(\d+(?:[.,]\d+)*)\s*(nghìn|ngàn|triệu|k(?!\w)|tr(?!\w)|đồng|vnđ|vnd|đ|₫)?",
+    re.IGNORECASE,
+)
+_PRICE_MULTIPLIERS = {"k": 1000, "nghìn": 1000, "ngàn": 1000, "tr": 1_000_000, "triệu": 1_000_000}
+
+
+def _parse_number(text: str) -> float:
+    # Dấu phân cách cuối cùng theo sau đúng 3 chữ số là phân cách hàng nghìn ("25.000"),
+    # ngược lại là dấu thập phân ("1.5", "2,5")
+    parts = re.split(r"[.,]", text)
+    if len(parts) == 1 or len(parts[-1]) == 3:
+        return float("".join(parts))
+    return float(f"{''.join(parts[:-1])}.{parts[-1]}")
+
+
+def parse_price(price: Optional[str]) -> Optional[int]:
+    # Giá theo VND: "25.000đ/kg" -> 25000, "1.5k" -> 1500, "500g: 20.000đ" -> 20000.
+    # Ưu tiên số đi kèm đơn vị tiền (đ, k, nghìn...) hơn số đứng đầu (trọng lượng, số lượng).
+    tokens = _PRICE_TOKEN.findall(price or "")
+    if not tokens:
+        return None
+    number, unit = next(((n, u) for n, u in tokens if u), tokens[0])
+    value = _parse_number(number) * _PRICE_MULTIPLIERS.get(unit.lower(), 1)
+    return int(round(value))
+
+
+def _name_norm(name: Optional[str]) -> Optional[str]:
+    return normalize_name(name) if name is not None else None
+
+
+def _fold_name(text: str) -> str:
+    return normalize_name(text, fold_diacritics=True)
+
+
+def _name_fold(name: Optional[str]) -> Optional[str]:
+    return _fold_name(name) if name is not None else None
+
+
+def _sync_name_norm(conn: sqlite3.Connection) -> int:
+    # Tính lại name_norm/name_fold bằng normalize_name hiện tại (vd sau khi đổi CLASSIFIER_WORDS).
+    # Tên mới bị trùng với sản phẩm khác thì để NULL và cảnh báo, không tự xoá dữ liệu.
+    changed = 0
+    rows = conn.execute("SELECT id, name, name_norm, name_fold FROM fruits ORDER BY id").fetchall()
+    conn.executemany("UPDATE fruits SET name_fold=? WHERE id=?", [
+        (_name_fold(name), fruit_id) for fruit_id, name, _norm, fold in rows if _name_fold(name) != fold
+    ])
+    stale = [(fruit_id, name) for fruit_id, name, norm, _fold in rows if _name_norm(name) != norm]
+    conn.executemany("UPDATE fruits SET name_norm=NULL WHERE id=?", [(fruit_id,) for fruit_id, _name in stale])
+    for fruit_id, name in stale:
+        try:
+            conn.execute("UPDATE fruits SET name_norm=? WHERE id=?", (_name_norm(name), fruit_id))
+            changed += 1
+        except sqlite3.IntegrityError:
+            logger.warning("Fruit %s (%r) normalizes to the same name as another fruit; lookups by name skip it",
+                           fruit_id, name)
+    return changed
+
+
+# === MIGRATIONS ===
+# Mỗi phần tử nâng PRAGMA user_version lên 1. Chỉ thêm vào cuối, không sửa bước cũ.
+def _migrate_create_fruits(conn: sqlite3.Connection):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS fruits (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT UNIQUE,
+            price TEXT,
+            description TEXT
+        )
+    """)
+
+
+def _migrate_create_aliases(conn: sqlite3.Connection):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS fruit_aliases (
+            alias TEXT PRIMARY KEY,
+            fruit_id INTEGER NOT NULL REFERENCES fruits(id) ON DELETE CASCADE
+        )
+    """)
+
+
+def _migrate_numeric_price(conn: sqlite3.Connection):
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(fruits)")]
+    if "price_value" not in columns:
+        conn.execute("ALTER TABLE fruits ADD COLUMN price_value INTEGER")
+    rows = conn.execute("SELECT id, price FROM fruits").fetchall()
+    conn.executemany("UPDATE fruits SET price_value=? WHERE id=?", [(parse_price(p), i) for i, p in rows])
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_fruits_price_value ON fruits(price_value, id)")
+
+
+def _migrate_name_norm(conn: sqlite3.Connection):
+    # Tên chuẩn hoá lưu ở cột thường chứ không index trên hàm Python: sqlite3 CLI hay
+    # kết nối không đăng ký hàm vẫn ghi được vào fruits; UNIQUE chặn tên trùng sau chuẩn hoá.
+    # name_fold (bỏ dấu) dùng cho tìm kiếm: LIKE trên cột thường, không gọi hàm Python mỗi dòng.
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(fruits)")]
+    if "name_norm" not in columns:
+        conn.execute("ALTER TABLE fruits ADD COLUMN name_norm TEXT")
+    if "name_fold" not in columns:
+        conn.execute("ALTER TABLE fruits ADD COLUMN name_fold TEXT")
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_fruits_name_norm ON fruits(name_norm)")
+    # Index hẹp để COUNT/tìm kiếm quét index thay vì cả bảng (có mô tả dài)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_fruits_name_fold ON fruits(name_fold)")
+    _sync_name_norm(conn)
+
+
+def _migrate_create_references(conn: sqlite3.Connection):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS fruit_references (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            fruit_id INTEGER NOT NULL REFERENCES fruits(id) ON DELETE CASCADE,
+            feature BLOB NOT NULL,
+            source TEXT NOT NULL,
+            created_at REAL NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_fruit_references_fruit ON fruit_references(fruit_id, source, id)")
+
+
+MIGRATIONS: List[Callable[[sqlite3.Connection], None]] = [
+    _migrate_create_fruits,
+    _migrate_create_aliases,
+    _migrate_numeric_price,
+    _migrate_name_norm,
+    _migrate_create_references,
+]
+
+
+# Cột sắp xếp cho trang danh sách: khoá (key) đi kèm id để phân trang keyset
+SORT_KEYS = {
+    "name": "name_norm",
+    "price": "price_value",
+}
+
+
+def _like_pattern(text: str) -> str:
+    escaped = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def _keyset_after(key: str, value, fruit_id: int) -> Tuple[str, tuple]:
+    # Thứ tự tăng dần, NULL (giá không đọc được) đứng đầu như SQLite
+    if value is None:
+        return f"(({key} IS NULL AND id > ?) OR {key} IS NOT NULL)", (fruit_id,)
+    # Điều kiện thừa "key >= ?" để SQLite tìm thẳng vào index thay vì quét từ đầu
+    return f"{key} >= ? AND ({key}, id) > (?, ?)", (value, value, fruit_id)
+
+
+def _keyset_before(key: str, value, fruit_id: int) -> Tuple[str, tuple]:
+    if value is None:
+        return f"({key} IS NULL AND id < ?)", (fruit_id,)
+    return f"({key} IS NULL OR ({key} <= ? AND ({key}, id) < (?, ?)))", (value, value, fruit_id)
+
+
+# === DATA ACCESS LAYER ===
+class FruitDB:
+    """Lớp truy cập fruits.db dùng chung cho bot.
+
+    Kết nối được giữ lâu dài: một pool nhỏ luồng đọc (mỗi luồng một kết nối)
+    và đúng một luồng ghi, chạy ở WAL mode để đọc không chặn ghi. Mọi truy vấn
+    chạy trên executor riêng nên handler chỉ cần await, event loop không bị chặn.
+    """
+
+    def __init__(self, path: str, readers: int = 2):
+        self.path = path
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        self._reader = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="fruitdb-read")
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fruitdb-write")
+
+    # --- connections ---
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        conn.execute("PRAGMA busy_timeout=5000")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        with self._connections_lock:
+            self._connections.append(conn)
+        return conn
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    async def _read(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._reader, lambda: fn(self._conn(), *args))
+
+    async def _write(self, fn, *args):
+        def run():
+            conn = self._conn()
+            with conn:
+                return fn(conn, *args)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._writer, run)
+
+    # --- schema ---
+    @staticmethod
+    def _apply_migrations(conn: sqlite3.Connection) -> int:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for target, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+            # BEGIN tường minh: sqlite3 của Python không tự mở transaction trước DDL, nên
+            # ALTER/CREATE sẽ tự commit và một bước lỗi giữa chừng không rollback được
+            conn.execute("BEGIN")
+            try:
+                migration(conn)
+                conn.execute(f"PRAGMA user_version={target}")
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+        return len(MIGRATIONS)
+
+    @classmethod
+    def _migrate(cls, conn: sqlite3.Connection) -> int:
+        version = cls._apply_migrations(conn)
+        with conn:
+            _sync_name_norm(conn)
+        return version
+
+    async def migrate(self) -> int:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._writer, lambda: self._migrate(self._conn()))
+
+    # --- queries ---
+    @staticmethod
+    def _select_by_name(conn: sqlite3.Connection, name: str) -> Optional[tuple]:
+        return conn.execute(
+            "SELECT id, name, price, description FROM fruits WHERE name_norm=?",
+            (normalize_name(name),),
+        ).fetchone()
+
+    async def get_fruit(self, name: str) -> Optional[tuple]:
+        return await self._read(self._select_by_name, name)
+
+    async def list_fruits(self) -> list:
+        return await self._read(
+            lambda conn: conn.execute("SELECT id, name, price, description FROM fruits ORDER BY id ASC").fetchall()
+        )
+
+    @staticmethod
+    def _search_clause(search: Optional[str]) -> Tuple[List[str], list]:
+        folded = _fold_name(search or "")
+        if not folded:
+            return [], []
+        return ["name_fold LIKE ? ESCAPE '\\'"], [_like_pattern(folded)]
+
+    async def page_fruits(self, sort: str = "name", search: Optional[str] = None,
+                          after: Optional[tuple] = None, before: Optional[tuple] = None,
+                          limit: int = 10) -> list:
+        """Một trang sản phẩm theo keyset (sort_key, id), không dùng OFFSET.
+
+        after/before là (sort_key, id) của dòng cuối/đầu trang đang xem. Trả về
+        tối đa limit dòng (id, name, price, description, sort_key) theo thứ tự tăng dần.
+        """
+        key = SORT_KEYS[sort]
+        clauses, params = self._search_clause(search)
+        if after is not None:
+            clause, values = _keyset_after(key, *after)
+        elif before is not None:
+            clause, values = _keyset_before(key, *before)
+        else:
+            clause, values = "", ()
+        if clause:
+            clauses.append(clause)
+            params.extend(values)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        direction = "DESC" if before is not None else "ASC"
+        sql = (
+            f"SELECT id, name, price, description, {key} FROM fruits {where} "
+            f"ORDER BY {key} {direction}, id {direction} LIMIT ?"
+        )
+
+        def query(conn):
+            rows = conn.execute(sql, (*params, limit)).fetchall()
+            return rows[::-1] if before is not None else rows
+        return await self._read(query)
+
+    async def count_fruits(self, search: Optional[str] = None) -> int:
+        clauses, params = self._search_clause(search)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        return await self._read(
+            lambda conn: conn.execute(f"SELECT COUNT(*) FROM fruits {where}", params).fetchone()[0]
+        )
+
+    async def export_fruits(self, consume: Callable[[Iterable[tuple]], object]):
+        # Đưa con trỏ (name, price, description, aliases) cho consume ghi file, không fetchall
+        def run(conn):
+            cursor = conn.execute("""
+                SELECT f.name, f.price, f.description,
+                       (SELECT GROUP_CONCAT(alias, '|') FROM fruit_aliases a WHERE a.fruit_id = f.id)
+                FROM fruits f ORDER BY f.id
+            """)
+            return consume(cursor)
+        return await self._read(run)
+
+    async def list_aliases(self) -> list:
+        return await self._read(lambda conn: conn.execute("SELECT alias, fruit_id FROM fruit_aliases").fetchall())
+
+    # --- writes ---
+    async def add_fruit(self, name: str, price: str, description: str) -> Optional[tuple]:
+        # Trả về dòng vừa thêm, hoặc None nếu tên đã tồn tại
+        def insert(conn):
+            if self._select_by_name(conn, name):
+                return None
+            conn.execute(
+                "INSERT INTO fruits (name, name_norm, name_fold, price, price_value, description) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (name, _name_norm(name), _name_fold(name), price, parse_price(price), description),
+            )
+            return self._select_by_name(conn, name)
+        return await self._write(insert)
+
+    async def update_fruit(self, name: str, price: str, description: str) -> Optional[tuple]:
+        def update(conn):
+            conn.execute(
+                "UPDATE fruits SET price=?, price_value=?, description=? WHERE name_norm=?",
+                (price, parse_price(price), description, normalize_name(name)),
+            )
+            return self._select_by_name(conn, name)
+        return await self._write(update)
+
+    async def delete_fruit(self, name: str) -> list:
+        # Trả về danh sách id đã xoá
+        def delete(conn):
+            ids = [row[0] for row in conn.execute(
+                "SELECT id FROM fruits WHERE name_norm=?", (normalize_name(name),)
+            )]
+            conn.executemany("DELETE FROM fruit_aliases WHERE fruit_id=?", [(i,) for i in ids])
+            conn.executemany("DELETE FROM fruit_references WHERE fruit_id=?", [(i,) for i in ids])
+            conn.executemany("DELETE FROM fruits WHERE id=?", [(i,) for i in ids])
+            return ids
+        return await self._write(delete)
+
+    async def add_alias(self, alias: str, fruit_id: int):
+        await self._write(lambda conn: conn.execute(
+            "INSERT OR REPLACE INTO fruit_aliases (alias, fruit_id) VALUES (?, ?)", (alias, fruit_id)
+        ))
+
+    async def import_fruits(self, rows: Iterable[dict]) -> dict:
+        """Thêm mới hoặc cập nhật theo tên trong một transaction.
+
+        Mỗi dòng là dict name/price/description/aliases (aliases đã chuẩn hoá).
+        Trả về số dòng inserted/updated cùng các dòng (id, name, price, description)
+        và cặp (alias, fruit_id) đã ghi để cập nhật chỉ mục trong bộ nhớ.
+        """
+        def upsert(conn):
+            result = {"inserted": 0, "updated": 0, "fruits": [], "aliases": []}
+            for row in rows:
+                existing = self._select_by_name(conn, row["name"])
+                if existing:
+                    conn.execute(
+                        "UPDATE fruits SET price=?, price_value=?, description=COALESCE(?, description) WHERE id=?",
+                        (row["price"], parse_price(row["price"]), row.get("description"), existing[0]),
+                    )
+                    fruit_id = existing[0]
+                    result["updated"] += 1
+                else:
+                    fruit_id = conn.execute(
+                        "INSERT INTO fruits (name, name_norm, name_fold, price, price_value, description) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (row["name"], _name_norm(row["name"]), _name_fold(row["name"]), row["price"],
+                         parse_price(row["price"]), row.get("description") or ""),
+                    ).lastrowid
+                    result["inserted"] += 1
+                aliases = [(alias, fruit_id) for alias in row.get("aliases") or ()]
+                conn.executemany("INSERT OR REPLACE INTO fruit_aliases (alias, fruit_id) VALUES (?, ?)", aliases)
+                result["aliases"].extend(aliases)
+                result["fruits"].append(conn.execute(
+                    "SELECT id, name, price, description FROM fruits WHERE id=?", (fruit_id,)
+                ).fetchone())
+            return result
+        return await self._write(upsert)
+
+    async def list_references(self) -> list:
+        return await self._read(
+            lambda conn: conn.execute("SELECT id, fruit_id, feature FROM fruit_references ORDER BY id").fetchall()
+        )
+
+    async def add_reference(self, fruit_id: int, feature: bytes, source: str,
+                            max_per_source: int = 0) -> Tuple[int, list]:
+        # Trả về (id mới, danh sách id cũ bị xoá do vượt max_per_source)
+        def insert(conn):
+            cursor = conn.execute(
+                "INSERT INTO fruit_references (fruit_id, feature, source, created_at) VALUES (?, ?, ?, ?)",
+                (fruit_id, feature, source, time.time()),
+            )
+            pruned = []
+            if max_per_source:
+                pruned = [row[0] for row in conn.execute(
+                    "SELECT id FROM fruit_references WHERE fruit_id=? AND source=? ORDER BY id DESC LIMIT -1 OFFSET ?",
+                    (fruit_id, source, max_per_source),
+                )]
+                conn.executemany("DELETE FROM fruit_references WHERE id=?", [(i,) for i in pruned])
+            return cursor.lastrowid, pruned
+        return await self._write(insert)
+
+    async def seed(self, fruits: list = DEFAULT_FRUITS) -> int:
+        def insert_many(conn):
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO fruits (name, name_norm, name_fold, price, price_value, description) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(name, _name_norm(name), _name_fold(name), price, parse_price(price), description)
+                 for name, price, description in fruits],
+            )
+            return conn.total_changes - before
+        return await self._write(insert_many)
+
+    def close(self):
+        self._reader.shutdown(wait=True)
+        self._writer.shutdown(wait=True)
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
@@ -0,0 +1,94 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class GeminiBatcher:
+    """Gom nhiều ảnh đến gần nhau thành một request generateContent.
+
+    Chờ tối đa max_wait giây hoặc đủ max_batch ảnh rồi gửi một lần qua
+    send_batch (trả về danh sách nhãn theo đúng thứ tự, hoặc None nếu không
+    đọc được kết quả). Chỉ khi kết quả không đọc được, từng ảnh mới được gửi
+    lại riêng qua send_single. Lỗi mạng/HTTP của batch (vd hết quota sau khi
+    đã retry) được trả nguyên cho mọi ảnh trong batch: gọi lại N request lẻ
+    lúc đang hết quota chỉ làm tình hình tệ hơn.
+
+    Quota request/phút được tính trên từng HTTP request (GeminiClient), nên
+    một batch N ảnh chỉ tốn 1 request quota thay vì N.
+    """
+
+    def __init__(self, send_single: Callable[[bytes, str], Awaitable[Optional[str]]],
+                 send_batch: Callable[[List[Tuple[bytes, str]]], Awaitable[Optional[list]]],
+                 max_batch: int = 4, max_wait: float = 0.15):
+        self.send_single = send_single
+        self.send_batch = send_batch
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._pending: list = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: set = set()
+        self._counters = {
+            "images": 0,
+            "batches": 0,
+            "single_calls": 0,
+            "fallbacks": 0,
+            "errors": 0,
+        }
+
+    async def submit(self, image_bytes: bytes, mime_type: str) -> Optional[str]:
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append(((image_bytes, mime_type), future))
+        self._counters["images"] += 1
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.create_task(self._send(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, batch: list):
+        items = [item for item, _future in batch]
+        futures = [future for _item, future in batch]
+        results = None
+        if len(batch) > 1:
+            self._counters["batches"] += 1
+            try:
+                results = await self.send_batch(items)
+            except Exception as e:
+                self._counters["errors"] += 1
+                logger.exception("Gemini batch request failed")
+                results = [e] * len(batch)
+            if results is None or len(results) != len(batch):
+                self._counters["fallbacks"] += 1
+                results = None
+        if results is None:
+            self._counters["single_calls"] += len(batch)
+            results = await asyncio.gather(
+                *(self.send_single(*item) for item in items), return_exceptions=True
+            )
+        for future, result in zip(futures, results):
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    async def aclose(self):
+        self._flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return dict(self._counters)
@@ -0,0 +1,160 @@
+import random
+import asyncio
+from collections import deque
+from typing import Callable, Optional
+
+import httpx
+
+from job_scheduler import TokenBucket
+
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class GeminiError(Exception):
+    pass
+
+
+class GeminiClient:
+    """Client Gemini bất đồng bộ dùng chung một pool kết nối keep-alive.
+
+    - Giới hạn số request đồng thời bằng semaphore.
+    - Tách timeout kết nối / đọc.
+    - Retry lỗi tạm thời (429/5xx, lỗi mạng) với backoff có jitter.
+    - Quota request/phút (requests_per_minute > 0): mỗi HTTP request gửi đi, kể cả
+      retry và hedge, lấy một token; request chờ tới khi còn quota.
+    - Tuỳ chọn gửi request "hedge" tới model dự phòng khi model chính chậm
+      hơn ngưỡng phân vị độ trễ gần đây. Độ trễ chỉ tính thời gian HTTP; không
+      hedge khi đã hết slot hoặc hết quota.
+    """
+
+    def __init__(self, api_key: str, model: str,
+                 base_url: str = "https://generativelanguage.googleapis.com/v1beta",
+                 max_concurrency: int = 8, connect_timeout: float = 5.0, read_timeout: float = 60.0,
+                 max_retries: int = 3, backoff_base: float = 0.5, backoff_max: float = 8.0,
+                 requests_per_minute: float = 0,
+                 hedge_model: Optional[str] = None, hedge_percentile: float = 0.95,
+                 hedge_min_samples: int = 20):
+        self.api_key = api_key
+        self.model = model
+        self.base_url = base_url.rstrip("/")
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_model = hedge_model or None
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._rpm: Optional[TokenBucket] = None
+        if requests_per_minute > 0:
+            self._rpm = TokenBucket(requests_per_minute / 60, max(1, requests_per_minute / 60 * 10))
+        self._latencies: deque = deque(maxlen=200)
+        self._client = httpx.AsyncClient(
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(
+                max_connections=max_concurrency * 2,
+                max_keepalive_connections=max_concurrency,
+                keepalive_expiry=60,
+            ),
+            headers={"x-goog-api-key": api_key},
+        )
+
+    def endpoint(self, model: str) -> str:
+        return f"{self.base_url}/models/{model}:generateContent"
+
+    def hedge_threshold(self) -> Optional[float]:
+        if not self.hedge_model or len(self._latencies) < self.hedge_min_samples:
+            return None
+        ordered = sorted(self._latencies)
+        index = min(len(ordered) - 1, int(self.hedge_percentile * len(ordered)))
+        return ordered[index]
+
+    def _backoff(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        if retry_after:
+            try:
+                return min(self.backoff_max, float(retry_after))
+            except ValueError:
+                pass
+        # Full jitter: ngẫu nhiên trong [0, base * 2^attempt]
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    async def _post(self, model: str, body: dict, on_send: Optional[Callable[[], None]] = None,
+                    prepaid: bool = False) -> dict:
+        # on_send: gọi ngay trước khi request thực sự gửi đi (đã có quota và slot);
+        # prepaid: token quota cho lần gửi đầu đã được lấy sẵn
+        loop = asyncio.get_running_loop()
+        last_error: Optional[Exception] = None
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            if self._rpm and not (prepaid and attempt == 0):
+                await self._rpm.acquire()
+            try:
+                async with self._semaphore:
+                    if on_send:
+                        on_send()
+                    # Chỉ đo thời gian HTTP, không tính lúc chờ quota/semaphore
+                    started = loop.time()
+                    try:
+                        response = await self._client.post(self.endpoint(model), json=body)
+                    except asyncio.CancelledError:
+                        # Bị huỷ vì hedge thắng: vẫn ghi nhận để ngưỡng phân vị không bị lệch thấp
+                        self._record_latency(model, loop.time() - started)
+                        raise
+                    self._record_latency(model, loop.time() - started)
+                if response.status_code not in RETRYABLE_STATUS:
+                    response.raise_for_status()
+                    return response.json()
+                retry_after = response.headers.get("retry-after")
+                last_error = GeminiError(f"HTTP {response.status_code} từ {model}")
+            except httpx.TransportError as e:
+                last_error = e
+            except httpx.HTTPStatusError as e:
+                raise GeminiError(f"HTTP {e.response.status_code} từ {model}: {e.response.text[:200]}") from e
+            if attempt < self.max_retries:
+                await asyncio.sleep(self._backoff(attempt, retry_after))
+        raise GeminiError(f"Gemini {model} thất bại sau {self.max_retries + 1} lần thử: {last_error}")
+
+    def _record_latency(self, model: str, seconds: float):
+        if model == self.model:
+            self._latencies.append(seconds)
+
+    def _can_hedge(self) -> bool:
+        # Hết slot hoặc hết quota thì hedge chỉ làm tải tăng đúng lúc đang thiếu: không gửi.
+        # Lấy token ngay tại đây để hedge không phải xếp hàng chờ quota.
+        if self._semaphore.locked():
+            return False
+        return self._rpm is None or self._rpm.try_acquire()
+
+    async def generate_content(self, body: dict) -> dict:
+        threshold = self.hedge_threshold()
+        if threshold is None:
+            return await self._post(self.model, body)
+
+        sent = asyncio.Event()
+        primary = asyncio.create_task(self._post(self.model, body, on_send=sent.set))
+        waiting = asyncio.create_task(sent.wait())
+        pending = {primary}
+        error: Optional[BaseException] = None
+        try:
+            # Đồng hồ hedge chạy từ lúc request chính thực sự được gửi, không tính lúc chờ quota
+            await asyncio.wait({primary, waiting}, return_when=asyncio.FIRST_COMPLETED)
+            done, pending = await asyncio.wait(pending, timeout=threshold)
+            if done:
+                return primary.result()
+            if not self._can_hedge():
+                return await primary
+            pending.add(asyncio.create_task(self._post(self.hedge_model, body, prepaid=True)))
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            waiting.cancel()
+            for task in pending:
+                task.cancel()
+
+    async def aclose(self):
+        await self._client.aclose()
@@ -0,0 +1,85 @@
+import io
+from typing import Optional, Sequence, Tuple
+
+from PIL import Image
+
+
+# Định dạng ảnh mà Gemini nhận trực tiếp qua inline_data
+SUPPORTED_MIME_TYPES = {"image/jpeg", "image/png", "image/webp", "image/heic", "image/heif"}
+
+_PIL_FORMAT_TO_MIME = {
+    "JPEG": "image/jpeg",
+    "PNG": "image/png",
+    "WEBP": "image/webp",
+}
+
+
+def select_photo_size(photo_sizes: Sequence, min_side: int):
+    # Chọn PhotoSize nhỏ nhất mà cạnh ngắn vẫn đủ min_side; nếu không có thì lấy ảnh lớn nhất
+    ordered = sorted(photo_sizes, key=lambda p: p.width * p.height)
+    for size in ordered:
+        if min(size.width, size.height) >= min_side:
+            return size
+    return ordered[-1]
+
+
+def sniff_mime_type(data: bytes, declared: Optional[str] = None) -> Optional[str]:
+    head = bytes(data[:12])
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if declared in SUPPORTED_MIME_TYPES:
+        return declared
+    return None
+
+
+def _flatten(img: Image.Image) -> Image.Image:
+    # JPEG không có kênh alpha: ghép lên nền trắng thay vì để nền đen
+    if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+        rgba = img.convert("RGBA")
+        background = Image.new("RGB", rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.getchannel("A"))
+        return background
+    return img.convert("RGB") if img.mode != "RGB" else img
+
+
+def prepare_image(data: bytes, mime_type: str, max_side: int = 768,
+                  max_bytes: int = 0) -> Tuple[bytes, str]:
+    """Thu nhỏ / nén lại ảnh trước khi gửi Gemini.
+
+    Ảnh đã nằm trong giới hạn (cạnh dài <= max_side, dung lượng <= max_bytes)
+    được trả về nguyên vẹn, không sao chép. max_side=0 hoặc max_bytes=0 để tắt
+    giới hạn tương ứng.
+    """
+    try:
+        img = Image.open(io.BytesIO(data))
+    except Exception:
+        return data, mime_type
+    with img:
+        width, height = img.size
+        source_mime = _PIL_FORMAT_TO_MIME.get(img.format, mime_type)
+        too_large = bool(max_side) and max(width, height) > max_side
+        too_heavy = bool(max_bytes) and len(data) > max_bytes
+        if not too_large and not too_heavy:
+            return data, source_mime
+
+        if too_large:
+            img.draft("RGB", (max_side, max_side))
+            img = _flatten(img)
+            img.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+        else:
+            img = _flatten(img)
+
+        out = io.BytesIO()
+        for quality in (85, 75, 65, 55, 45):
+            out.seek(0)
+            out.truncate()
+            img.save(out, format="JPEG", quality=quality, optimize=True)
+            if not max_bytes or out.tell() <= max_bytes:
+                break
+        if not too_large and out.tell() >= len(data):
+            return data, source_mime
+        return out.getvalue(), "image/jpeg"
@@ -0,0 +1,232 @@
+import time
+import asyncio
+import contextvars
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Optional
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class RateLimitedError(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__(f"Rate limited, retry after {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    def __init__(self, rate_per_second: float, capacity: float):
+        self.rate = rate_per_second
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, amount: float = 1) -> bool:
+        self._refill()
+        if self.tokens >= amount:
+            self.tokens -= amount
+            return True
+        return False
+
+    def time_until(self, amount: float = 1) -> float:
+        self._refill()
+        missing = min(amount, self.capacity) - self.tokens
+        return max(0.0, missing / self.rate) if self.rate > 0 else float("inf")
+
+    async def acquire(self, amount: float = 1):
+        amount = min(amount, self.capacity)
+        while not self.try_acquire(amount):
+            await asyncio.sleep(self.time_until(amount))
+
+
+class _Job:
+    __slots__ = ("user_id", "fn", "weight", "future", "enqueued_at", "context")
+
+    def __init__(self, user_id: int, fn: Callable[[], Awaitable], weight: int = 1):
+        self.user_id = user_id
+        self.fn = fn
+        self.weight = weight
+        self.future = asyncio.get_running_loop().create_future()
+        self.enqueued_at = time.monotonic()
+        # Job chạy trong context của người gửi (giữ correlation ID cho log/metrics)
+        self.context = contextvars.copy_context()
+
+
+class RecognitionScheduler:
+    """Hàng đợi công việc nhận diện giữa handler và pipeline nhận diện.
+
+    - Token bucket theo từng người dùng: gửi dồn dập bị từ chối sớm.
+    - Giới hạn toàn cục số job chạy đồng thời.
+    - Round-robin giữa người dùng để một người không chiếm hết hàng đợi;
+      job của admin được ưu tiên.
+
+    Job có trọng số (vd số ảnh của album): token bucket trừ theo trọng số (tối đa
+    bằng dung lượng bucket) và round-robin tính theo deficit, nên album 10 ảnh tốn
+    10 lượt như 10 ảnh lẻ chứ không phải một lượt.
+
+    Quota request/phút của Gemini không tính ở đây mà ở GeminiClient, khi request
+    thực sự được gửi: ảnh trúng cache hay bộ phân loại CPU không phải chờ quota.
+    """
+
+    def __init__(self, max_concurrency: int = 8, user_rate_per_minute: float = 10,
+                 user_burst: int = 5, max_queue: int = 100):
+        self.max_queue = max_queue
+        self.user_rate = user_rate_per_minute / 60
+        self.user_burst = user_burst
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._buckets: dict = {}
+        self._queues: "OrderedDict[int, deque]" = OrderedDict()
+        self._credits: dict = {}
+        self._priority: deque = deque()
+        self._size = 0
+        self._wakeup = asyncio.Event()
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._running: set = set()
+        self._wait_times: deque = deque(maxlen=500)
+        self._counters = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "rejected_queue_full": 0,
+            "rejected_rate_limited": 0,
+            "max_depth": 0,
+        }
+
+    # --- admission ---
+    def _admit(self, user_id: int, priority: bool, weight: int):
+        if self._size >= self.max_queue:
+            self._counters["rejected_queue_full"] += 1
+            raise QueueFullError()
+        if priority:
+            return
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            if len(self._buckets) >= 10000:
+                self._prune_buckets()
+            bucket = self._buckets[user_id] = TokenBucket(self.user_rate, self.user_burst)
+        # Album lớn hơn burst vẫn nhận được khi bucket đầy, nhưng dùng hết bucket
+        cost = min(weight, bucket.capacity)
+        if not bucket.try_acquire(cost):
+            self._counters["rejected_rate_limited"] += 1
+            raise RateLimitedError(bucket.time_until(cost))
+
+    def _prune_buckets(self):
+        # Bucket đã đầy lại = người dùng không hoạt động, tạo lại khi cần cũng như nhau
+        for user_id in [u for u, b in self._buckets.items() if b.time_until(b.capacity) == 0]:
+            del self._buckets[user_id]
+
+    def submit(self, user_id: int, fn: Callable[[], Awaitable], priority: bool = False,
+               weight: int = 1) -> asyncio.Future:
+        # Ném QueueFullError / RateLimitedError ngay lập tức nếu không nhận job
+        weight = max(1, weight)
+        self._admit(user_id, priority, weight)
+        job = _Job(user_id, fn, weight)
+        if priority:
+            self._priority.append(job)
+        else:
+            self._queues.setdefault(user_id, deque()).append(job)
+        self._size += 1
+        self._counters["submitted"] += 1
+        self._counters["max_depth"] = max(self._counters["max_depth"], self._size)
+        self._wakeup.set()
+        return job.future
+
+    # --- dispatch ---
+    def _next_job(self) -> Optional[_Job]:
+        if self._priority:
+            return self._priority.popleft()
+        while self._queues:
+            # Deficit round-robin: mỗi lượt người dùng được thêm 1 điểm, job chạy khi đủ điểm bằng trọng số
+            user_id, queue = next(iter(self._queues.items()))
+            credit = self._credits.get(user_id, 0) + 1
+            if credit < queue[0].weight:
+                self._credits[user_id] = credit
+                self._queues.move_to_end(user_id)
+                continue
+            job = queue.popleft()
+            if queue:
+                self._credits[user_id] = credit - job.weight
+                self._queues.move_to_end(user_id)
+            else:
+                del self._queues[user_id]
+                self._credits.pop(user_id, None)
+            return job
+        return None
+
+    async def _dispatch(self):
+        while True:
+            if self._size == 0:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            await self._semaphore.acquire()
+            job = self._next_job()
+            if job is None:
+                self._semaphore.release()
+                continue
+            self._size -= 1
+            if job.future.cancelled():
+                self._semaphore.release()
+                continue
+            self._wait_times.append(time.monotonic() - job.enqueued_at)
+            task = job.context.run(asyncio.create_task, self._run(job))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run(self, job: _Job):
+        try:
+            result = await job.fn()
+        except Exception as e:
+            self._counters["failed"] += 1
+            if not job.future.done():
+                job.future.set_exception(e)
+        else:
+            self._counters["completed"] += 1
+            if not job.future.done():
+                job.future.set_result(result)
+        finally:
+            self._semaphore.release()
+
+    # --- lifecycle ---
+    def start(self):
+        if self._dispatcher is None:
+            self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def stop(self):
+        if self._dispatcher:
+            self._dispatcher.cancel()
+            try:
+                await self._dispatcher
+            except asyncio.CancelledError:
+                pass
+            self._dispatcher = None
+        if self._running:
+            await asyncio.gather(*self._running, return_exceptions=True)
+        while True:
+            job = self._next_job()
+            if job is None:
+                break
+            if not job.future.done():
+                job.future.set_exception(QueueFullError())
+        self._size = 0
+
+    # --- metrics ---
+    def stats(self) -> dict:
+        stats = dict(self._counters)
+        stats["queue_depth"] = self._size
+        stats["running"] = len(self._running)
+        stats["waiting_users"] = len(self._queues)
+        waits = sorted(self._wait_times)
+        if waits:
+            stats["wait_p50"] = waits[len(waits) // 2]
+            stats["wait_p95"] = waits[min(len(waits) - 1, int(len(waits) * 0.95))]
+            stats["wait_max"] = waits[-1]
+        else:
+            stats["wait_p50"] = stats["wait_p95"] = stats["wait_max"] = 0.0
+        return stats
@@ -0,0 +1,96 @@
+import io
+import math
+import threading
+from array import array
+from typing import Iterable, Optional, Tuple
+
+from PIL import Image
+
+
+# Histogram màu HSV: 12 mức hue x 4 saturation x 4 value = 192 chiều
+H_BINS, S_BINS, V_BINS = 12, 4, 4
+FEATURE_SIZE = 64
+
+
+def extract_features(image_bytes: bytes) -> Optional[array]:
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as img:
+            img.draft("RGB", (FEATURE_SIZE * 2, FEATURE_SIZE * 2))
+            hsv = img.convert("RGB").resize((FEATURE_SIZE, FEATURE_SIZE), Image.Resampling.BILINEAR).convert("HSV")
+    except Exception:
+        return None
+    h, s, v = (channel.tobytes() for channel in hsv.split())
+    histogram = [0.0] * (H_BINS * S_BINS * V_BINS)
+    for hue, sat, val in zip(h, s, v):
+        histogram[(hue * H_BINS >> 8) * S_BINS * V_BINS + (sat * S_BINS >> 8) * V_BINS + (val * V_BINS >> 8)] += 1
+    # Căn bậc hai rồi chuẩn hoá L2: tích vô hướng = hệ số Bhattacharyya giữa 2 histogram
+    vector = [math.sqrt(count) for count in histogram]
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return array("f", (x / norm for x in vector))
+
+
+def features_to_blob(features: array) -> bytes:
+    return features.tobytes()
+
+
+def features_from_blob(blob: bytes) -> array:
+    features = array("f")
+    features.frombytes(blob)
+    return features
+
+
+class LocalClassifier:
+    """Bộ phân loại k-NN chạy trên CPU, trả lời các ca chắc chắn mà không cần Gemini.
+
+    Tham chiếu là histogram màu của ảnh đã gán nhãn theo từng sản phẩm (admin
+    gắn qua /addref hoặc học từ kết quả Gemini khớp catalog).
+    """
+
+    def __init__(self, k: int = 5, min_vote: float = 0.8, min_similarity: float = 0.9):
+        self.k = k
+        self.min_vote = min_vote
+        self.min_similarity = min_similarity
+        self._lock = threading.Lock()
+        self._references: list = []
+
+    def __len__(self) -> int:
+        return len(self._references)
+
+    def load(self, references: Iterable[Tuple[int, int, bytes]]):
+        loaded = [(ref_id, fruit_id, features_from_blob(blob)) for ref_id, fruit_id, blob in references]
+        with self._lock:
+            self._references = loaded
+
+    def add(self, ref_id: int, fruit_id: int, features: array):
+        with self._lock:
+            self._references.append((ref_id, fruit_id, features))
+
+    def remove_references(self, ref_ids: Iterable[int]):
+        ref_ids = set(ref_ids)
+        with self._lock:
+            self._references = [ref for ref in self._references if ref[0] not in ref_ids]
+
+    def remove_fruit(self, fruit_id: int):
+        with self._lock:
+            self._references = [ref for ref in self._references if ref[1] != fruit_id]
+
+    def classify(self, features: array) -> Tuple[Optional[int], float]:
+        """Trả về (fruit_id, độ tin cậy); fruit_id là None khi chưa đủ chắc chắn."""
+        with self._lock:
+            references = list(self._references)
+        if len(references) < self.k:
+            return None, 0.0
+        scored = sorted(
+            ((sum(a * b for a, b in zip(features, ref_features)), fruit_id)
+             for _ref_id, fruit_id, ref_features in references),
+            reverse=True,
+        )[:self.k]
+        votes: dict = {}
+        for similarity, fruit_id in scored:
+            votes[fruit_id] = votes.get(fruit_id, 0.0) + similarity
+        best_id = max(votes, key=votes.get)
+        confidence = votes[best_id] / (sum(votes.values()) or 1.0)
+        top_similarity = max(similarity for similarity, fruit_id in scored if fruit_id == best_id)
+        if confidence >= self.min_vote and top_similarity >= self.min_similarity:
+            return best_id, confidence
+        return None, confidence
@@ -0,0 +1,245 @@
+import json
+import time
+import asyncio
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Callable, Optional, Sequence
+
+
+# Bật/tắt toàn bộ việc đo (METRICS_ENABLED); khi tắt, stage() và inc()/observe() không làm gì
+enabled = True
+
+correlation_id: contextvars.ContextVar = contextvars.ContextVar("correlation_id", default="-")
+_stage_timings: contextvars.ContextVar = contextvars.ContextVar("stage_timings", default=None)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+# === METRIC TYPES ===
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: dict = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        if not enabled:
+            return
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def collect(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values: dict = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        if not enabled:
+            return
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0, 0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+            entry[1] += 1
+            entry[2] += value
+
+    def collect(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (bucket_counts, count, total) in sorted(self._values.items()):
+                for bound, bucket_count in zip(self.buckets, bucket_counts):
+                    labels = _format_labels(self.labelnames, key, f'le="{bound}"')
+                    lines.append(f"{self.name}_bucket{labels} {bucket_count}")
+                labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{labels} {count}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+        return lines
+
+
+class CallbackGauge:
+    # Giá trị đọc tại thời điểm scrape, vd: số job đang chờ trong hàng đợi
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, callback: Callable[[], Optional[float]]):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+
+    def collect(self) -> list:
+        try:
+            value = self.callback()
+        except Exception:
+            value = None
+        if value is None:
+            return []
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}", f"{self.name} {value}"]
+
+
+class CallbackCounter(CallbackGauge):
+    # Bộ đếm chỉ tăng được giữ ở nơi khác (vd stats() của scheduler), đọc lúc scrape
+    kind = "counter"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "bot_stage_duration_seconds", "Thời gian xử lý theo từng bước", ["stage"]
+))
+ERRORS = REGISTRY.register(Counter(
+    "bot_errors_total", "Số lỗi theo bước và nguyên nhân", ["stage", "cause"]
+))
+UPDATES = REGISTRY.register(Counter(
+    "bot_updates_total", "Số update đã xử lý theo handler", ["handler"]
+))
+GEMINI_TOKENS = REGISTRY.register(Counter(
+    "bot_gemini_tokens_total", "Token Gemini theo usageMetadata", ["kind"]
+))
+
+
+def gauge(name: str, documentation: str, callback: Callable[[], Optional[float]]):
+    return REGISTRY.register(CallbackGauge(name, documentation, callback))
+
+
+def counter(name: str, documentation: str, callback: Callable[[], Optional[float]]):
+    return REGISTRY.register(CallbackCounter(name, documentation, callback))
+
+
+def record_gemini_usage(response: dict):
+    usage = response.get("usageMetadata") or {}
+    for field, kind in (("promptTokenCount", "prompt"), ("candidatesTokenCount", "candidates"),
+                        ("thoughtsTokenCount", "thoughts"), ("totalTokenCount", "total")):
+        if usage.get(field):
+            GEMINI_TOKENS.inc(usage[field], kind=kind)
+
+
+# === STAGE TIMING ===
+@contextmanager
+def stage(name: str):
+    if not enabled:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        ERRORS.inc(stage=name, cause=type(e).__name__)
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage=name)
+        timings = _stage_timings.get()
+        if timings is not None:
+            timings[name] = round(timings.get(name, 0.0) + elapsed, 4)
+
+
+def start_request(request_id) -> dict:
+    # Gắn correlation ID cho update hiện tại; trả về dict gom thời gian từng bước để ghi log
+    correlation_id.set(str(request_id))
+    timings: dict = {}
+    _stage_timings.set(timings)
+    return timings
+
+
+# === STRUCTURED LOGS ===
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "correlation_id": correlation_id.get(),
+        }
+        entry.update(getattr(record, "fields", None) or {})
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def setup_logging(json_logs: bool, level: int = logging.INFO):
+    handler = logging.StreamHandler()
+    if json_logs:
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(level)
+    # Log của httpx chứa URL từng request -> chỉ giữ cảnh báo
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+
+# === HTTP ENDPOINT ===
+async def _handle_http(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+        while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b"\r\n", b"\n", b""):
+            pass
+        parts = request_line.decode("latin-1").split()
+        if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+            status, body = "200 OK", REGISTRY.render().encode()
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        else:
+            status, body, content_type = "404 Not Found", b"not found\n", "text/plain"
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def start_http_server(host: str, port: int) -> asyncio.AbstractServer:
+    return await asyncio.start_server(_handle_http, host, port)
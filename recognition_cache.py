@@ -0,0 +1,205 @@
+import io
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from PIL import Image
+
+
+# === PERCEPTUAL HASH ===
+def dhash(image_bytes: bytes, hash_size: int = 8) -> Optional[int]:
+    # Difference hash: so sánh độ sáng các pixel liền kề trên ảnh thu nhỏ (64 bit)
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as img:
+            img.draft("L", (hash_size * 8, hash_size * 8))
+            small = img.convert("L").resize((hash_size + 1, hash_size), Image.Resampling.LANCZOS)
+            pixels = list(small.getdata())
+    except Exception:
+        return None
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def _is_informative(phash: Optional[int]) -> bool:
+    # Ảnh trơn/gradient đều cho hash toàn 0 hoặc toàn 1 -> không dùng để so khớp gần đúng
+    return phash is not None and phash not in (0, (1 << 64) - 1)
+
+
+def _to_signed64(value: int) -> int:
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def _to_unsigned64(value: int) -> int:
+    return value + (1 << 64) if value < 0 else value
+
+
+# === CACHE ===
+class RecognitionCache:
+    """Cache kết quả nhận diện: file_unique_id -> SHA-256 nội dung -> perceptual hash.
+
+    Gồm 2 tầng: LRU trong bộ nhớ (có TTL) và SQLite để giữ kết quả sau khi khởi động lại.
+    """
+
+    def __init__(self, db_path: str, max_entries: int = 1024, ttl: float = 86400,
+                 db_ttl: float = 30 * 86400, phash_distance: int = 6, max_phashes: int = 5000):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.db_ttl = db_ttl
+        self.phash_distance = phash_distance
+        self.max_phashes = max_phashes
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._phashes: "OrderedDict[int, Tuple[str, float]]" = OrderedDict()
+        self._counters = {
+            "hits_memory": 0,
+            "hits_sqlite": 0,
+            "hits_phash": 0,
+            "misses": 0,
+        }
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._init_db()
+
+    def _init_db(self):
+        cursor = self._conn.cursor()
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS recognition_cache (
+                key TEXT PRIMARY KEY,
+                label TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS recognition_phash (
+                phash INTEGER PRIMARY KEY,
+                label TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+        cutoff = time.time() - self.db_ttl
+        cursor.execute("DELETE FROM recognition_cache WHERE created_at < ?", (cutoff,))
+        cursor.execute("DELETE FROM recognition_phash WHERE created_at < ?", (cutoff,))
+        self._conn.commit()
+        cursor.execute(
+            "SELECT phash, label, created_at FROM recognition_phash ORDER BY created_at DESC LIMIT ?",
+            (self.max_phashes,),
+        )
+        for phash, label, created_at in reversed(cursor.fetchall()):
+            self._phashes[_to_unsigned64(phash)] = (label, created_at)
+
+    # --- memory tier ---
+    def _memory_get(self, key: str) -> Optional[str]:
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+        label, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._memory[key]
+            return None
+        self._memory.move_to_end(key)
+        return label
+
+    def _memory_put(self, key: str, label: str):
+        self._memory[key] = (label, time.monotonic() + self.ttl)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    # --- lookups ---
+    def _get_key(self, key: str) -> Optional[str]:
+        label = self._memory_get(key)
+        if label is not None:
+            self._counters["hits_memory"] += 1
+            return label
+        row = self._conn.execute(
+            "SELECT label FROM recognition_cache WHERE key=? AND created_at >= ?",
+            (key, time.time() - self.db_ttl),
+        ).fetchone()
+        if row:
+            self._counters["hits_sqlite"] += 1
+            self._memory_put(key, row[0])
+            return row[0]
+        return None
+
+    def _get_phash(self, phash: int) -> Optional[str]:
+        best_label, best_distance = None, self.phash_distance + 1
+        for candidate, (label, _created_at) in self._phashes.items():
+            distance = (candidate ^ phash).bit_count()
+            if distance < best_distance:
+                best_label, best_distance = label, distance
+                if distance == 0:
+                    break
+        return best_label
+
+    def get_by_file_id(self, file_unique_id: str) -> Optional[str]:
+        # Không tính miss ở đây: miss chỉ được ghi nhận sau khi đã thử cả nội dung ảnh
+        with self._lock:
+            return self._get_key(f"fuid:{file_unique_id}")
+
+    def get_by_content(self, image_bytes: bytes) -> Tuple[Optional[str], dict]:
+        """Tra cache theo nội dung ảnh. Trả về (nhãn, keys) để dùng lại khi put()."""
+        keys = {
+            "sha": hashlib.sha256(image_bytes).hexdigest(),
+            "phash": dhash(image_bytes),
+        }
+        if not _is_informative(keys["phash"]):
+            keys["phash"] = None
+        with self._lock:
+            label = self._get_key(f"sha:{keys['sha']}")
+            if label is None and keys["phash"] is not None:
+                label = self._get_phash(keys["phash"])
+                if label is not None:
+                    self._counters["hits_phash"] += 1
+            if label is None:
+                self._counters["misses"] += 1
+        return label, keys
+
+    # --- store ---
+    def put(self, label: str, file_unique_id: Optional[str] = None, keys: Optional[dict] = None):
+        if not label:
+            return
+        keys = keys or {}
+        now = time.time()
+        entries = []
+        if file_unique_id:
+            entries.append(f"fuid:{file_unique_id}")
+        if keys.get("sha"):
+            entries.append(f"sha:{keys['sha']}")
+        with self._lock:
+            for key in entries:
+                self._memory_put(key, label)
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO recognition_cache (key, label, created_at) VALUES (?, ?, ?)",
+                [(key, label, now) for key in entries],
+            )
+            phash = keys.get("phash")
+            if phash is not None:
+                self._phashes[phash] = (label, now)
+                self._phashes.move_to_end(phash)
+                while len(self._phashes) > self.max_phashes:
+                    self._phashes.popitem(last=False)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO recognition_phash (phash, label, created_at) VALUES (?, ?, ?)",
+                    (_to_signed64(phash), label, now),
+                )
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._counters)
+            stats["memory_entries"] = len(self._memory)
+            stats["phash_entries"] = len(self._phashes)
+        hits = stats["hits_memory"] + stats["hits_sqlite"] + stats["hits_phash"]
+        total = hits + stats["misses"]
+        stats["hit_rate"] = hits / total if total else 0.0
+        return stats
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
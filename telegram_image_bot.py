@@ -1,31 +1,120 @@
 import os
 import io
+import json
+import math
+import functools
+import logging
+import argparse
 import base64
 import asyncio
 import requests
-import sqlite3
 from typing import Optional
 from dotenv import load_dotenv
-from telegram import Update, InputFile, ReplyKeyboardMarkup
+import metrics
+from metrics import stage
+from recognition_cache import RecognitionCache
+from gemini_client import GeminiClient
+from gemini_batcher import GeminiBatcher
+from catalog_index import CatalogIndex, normalize_name
+from fruit_db import FruitDB
+from job_scheduler import RecognitionScheduler, QueueFullError, RateLimitedError
+from local_classifier import LocalClassifier, extract_features, features_to_blob
+from image_preprocess import SUPPORTED_MIME_TYPES, select_photo_size, sniff_mime_type, prepare_image
+from catalog_io import detect_format, parse_catalog, write_csv, write_json
+from telegram import Update, InputFile, ReplyKeyboardMarkup, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.helpers import escape_markdown
 from telegram.ext import (
     ApplicationBuilder, ContextTypes, CommandHandler, MessageHandler,
-    ConversationHandler, filters
+    CallbackQueryHandler, ConversationHandler, filters
 )
 
 # === LOAD ENVIRONMENT VARIABLES ===
 load_dotenv()
 
+logger = logging.getLogger("pmsshop")
+
 # === CONFIG ===
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-pro")
 ADMIN_ID = int(os.getenv("ADMIN_ID", "6079753756"))  # ID Telegram của admin
 
-GEMINI_ENDPOINT = f"https://generativelanguage.googleapis.com/v1beta/models/{GEMINI_MODEL}:generateContent"
-DB_PATH = "fruits.db"
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com/v1beta")
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+GEMINI_CONNECT_TIMEOUT = float(os.getenv("GEMINI_CONNECT_TIMEOUT", "5"))
+GEMINI_READ_TIMEOUT = float(os.getenv("GEMINI_READ_TIMEOUT", "60"))
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "3"))
+# Model dự phòng nhanh hơn (vd: gemini-2.5-flash), để trống để tắt hedging
+GEMINI_HEDGE_MODEL = os.getenv("GEMINI_HEDGE_MODEL", "")
+GEMINI_HEDGE_PERCENTILE = float(os.getenv("GEMINI_HEDGE_PERCENTILE", "0.95"))
+# Gom tối đa N ảnh trong T mili giây vào 1 request (N=1 để tắt)
+GEMINI_BATCH_SIZE = int(os.getenv("GEMINI_BATCH_SIZE", "4"))
+GEMINI_BATCH_WAIT_MS = int(os.getenv("GEMINI_BATCH_WAIT_MS", "150"))
+DB_PATH = os.getenv("DB_PATH", "fruits.db")
+DB_READERS = int(os.getenv("DB_READERS", "2"))
+
+# Cache nhận diện: ảnh lặp lại (sticker, ảnh catalogue gửi lại) không cần gọi Gemini
+CACHE_DB_PATH = os.getenv("CACHE_DB_PATH", os.path.join(os.path.dirname(DB_PATH), "recognition_cache.db"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1024"))
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", "86400"))
+CACHE_DB_TTL_SECONDS = float(os.getenv("CACHE_DB_TTL_SECONDS", str(30 * 86400)))
+CACHE_PHASH_DISTANCE = int(os.getenv("CACHE_PHASH_DISTANCE", "6"))
 
 WELCOME_GIF_URL = "https://media0.giphy.com/media/v1.Y2lkPTc5MGI3NjExOHltNTQzczM1bWN6c2VnMnQzb3YyMDJmMTJqcjJjN2hrNHI5MHd4ayZlcD12MV9pbnRlcm5hbF9naWZfYnlfaWQmY3Q9Zw/k5gCYqpdDZEEpW5Lyz/giphy.gif"
 
+# Chế độ chạy: "polling" (mặc định) hoặc "webhook" (có thể ghi đè bằng --mode)
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+# Số update xử lý song song: 1 request Gemini chậm không làm kẹt người dùng khác
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", "16"))
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")  # URL public, vd: https://bot.example.com
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "127.0.0.1")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "telegram")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+# Cho phép trỏ tới Bot API server khác (local Bot API server hoặc server giả khi test)
+TELEGRAM_API_BASE_URL = os.getenv("TELEGRAM_API_BASE_URL", "https://api.telegram.org/bot")
+TELEGRAM_FILE_BASE_URL = os.getenv("TELEGRAM_FILE_BASE_URL", "https://api.telegram.org/file/bot")
+
+# Quota Gemini (request/phút), tính trên từng HTTP request thực sự gửi đi (kể cả retry, batch)
+GEMINI_RPM = float(os.getenv("GEMINI_RPM", "60"))
+# Điều phối job nhận diện: giới hạn đồng thời, chia đều giữa người dùng
+SCHED_MAX_CONCURRENCY = int(os.getenv("SCHED_MAX_CONCURRENCY", str(GEMINI_MAX_CONCURRENCY)))
+USER_RATE_PER_MINUTE = float(os.getenv("USER_RATE_PER_MINUTE", "10"))
+USER_BURST = int(os.getenv("USER_BURST", "5"))
+SCHED_MAX_QUEUE = int(os.getenv("SCHED_MAX_QUEUE", "100"))
+# Thời gian chờ gom đủ ảnh của 1 album (media group) trước khi xử lý
+ALBUM_WAIT_SECONDS = float(os.getenv("ALBUM_WAIT_SECONDS", "1.0"))
+
+# Bộ phân loại CPU chạy trước Gemini: chỉ trả lời khi đủ chắc chắn
+LOCAL_CLASSIFIER_ENABLED = os.getenv("LOCAL_CLASSIFIER_ENABLED", "1") == "1"
+LOCAL_CLASSIFIER_K = int(os.getenv("LOCAL_CLASSIFIER_K", "5"))
+LOCAL_CLASSIFIER_MIN_VOTE = float(os.getenv("LOCAL_CLASSIFIER_MIN_VOTE", "0.8"))
+LOCAL_CLASSIFIER_MIN_SIMILARITY = float(os.getenv("LOCAL_CLASSIFIER_MIN_SIMILARITY", "0.9"))
+# Số ảnh tham chiếu tối đa học tự động từ Gemini cho mỗi sản phẩm
+LOCAL_CLASSIFIER_MAX_LEARNED = int(os.getenv("LOCAL_CLASSIFIER_MAX_LEARNED", "50"))
+
+# Đo thời gian từng bước + endpoint Prometheus (/metrics) + log JSON có correlation ID
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+# 9464 thay vì 9090 (cổng mặc định của chính Prometheus); 0 để tắt endpoint HTTP
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9464"))
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")  # "json" hoặc "text"
+
+# Tiền xử lý ảnh: chọn PhotoSize vừa đủ, thu nhỏ/nén lại trước khi gửi Gemini.
+# Cạnh dài <= 768px để ảnh nằm gọn trong 1 tile của Gemini (ít token hơn).
+IMAGE_MIN_SIDE = int(os.getenv("IMAGE_MIN_SIDE", "512"))
+IMAGE_MAX_SIDE = int(os.getenv("IMAGE_MAX_SIDE", "768"))
+IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", "400000"))
+# Giới hạn tải file của Bot API (getFile)
+MAX_DOCUMENT_BYTES = 20 * 1024 * 1024
+
+# Tra tên sản phẩm: bỏ dấu tiếng Việt khi so khớp, sai khác tối đa N ký tự
+CATALOG_FOLD_DIACRITICS = os.getenv("CATALOG_FOLD_DIACRITICS", "1") == "1"
+CATALOG_FUZZY_MAX_DISTANCE = int(os.getenv("CATALOG_FUZZY_MAX_DISTANCE", "2"))
+# /listfruits: số sản phẩm mỗi trang; /importfruits: dung lượng file tối đa
+CATALOG_PAGE_SIZE = int(os.getenv("CATALOG_PAGE_SIZE", "10"))
+CATALOG_IMPORT_MAX_BYTES = int(os.getenv("CATALOG_IMPORT_MAX_BYTES", str(5 * 1024 * 1024)))
+
 # === PROMPT ===
 VIETNAMESE_PROMPT = (
     "Bạn là hệ thống nhận diện hình ảnh. "
@@ -33,38 +122,85 @@ VIETNAMESE_PROMPT = (
     "không kèm câu giải thích, chỉ 1 từ hoặc cụm từ ngắn (ví dụ: 'chuối', 'xoài', 'cam')."
 )
 
+BATCH_PROMPT = (
+    "Bạn là hệ thống nhận diện hình ảnh. "
+    "Dưới đây là {count} ảnh được đánh số theo thứ tự. "
+    "Với mỗi ảnh, hãy xác định loại trái cây và trả về một mảng JSON gồm đúng {count} chuỗi, "
+    "mỗi chuỗi là tên loại trái cây bằng tiếng Việt (1 từ hoặc cụm từ ngắn, ví dụ: 'chuối', 'xoài', 'cam'), "
+    "theo đúng thứ tự ảnh. Nếu không nhận diện được thì dùng chuỗi rỗng. Không kèm giải thích."
+)
+
 # === DATABASE ===
-def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS fruits (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT UNIQUE,
-            price TEXT,
-            description TEXT
-        )
-    """)
-    conn.commit()
-    conn.close()
+fruit_db = FruitDB(DB_PATH, readers=DB_READERS)
+
+async def init_db():
+    await fruit_db.migrate()
+
+# === CATALOG INDEX ===
+catalog_index = CatalogIndex(fold_diacritics=CATALOG_FOLD_DIACRITICS, max_distance=CATALOG_FUZZY_MAX_DISTANCE)
+
+async def load_catalog_index():
+    catalog_index.load(await fruit_db.list_fruits(), await fruit_db.list_aliases())
+
+async def apply_catalog_changes(fruits: list, aliases: list = (), chunk: int = 500):
+    # Cập nhật chỉ mục sau khi nhập hàng loạt, nhường event loop sau mỗi chunk dòng
+    for start in range(0, len(fruits), chunk):
+        for row in fruits[start:start + chunk]:
+            catalog_index.upsert(*row)
+        await asyncio.sleep(0)
+    for start in range(0, len(aliases), chunk):
+        for alias, fruit_id in aliases[start:start + chunk]:
+            catalog_index.add_alias(alias, fruit_id)
+        await asyncio.sleep(0)
 
 def get_fruit_info(fruit_name: str) -> Optional[dict]:
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT name, price, description FROM fruits WHERE LOWER(name)=?", (fruit_name.lower(),))
-    row = cursor.fetchone()
-    conn.close()
-    if row:
-        return {"name": row[0], "price": row[1], "description": row[2]}
+    info = catalog_index.lookup(fruit_name)
+    if info:
+        return {"name": info["name"], "price": info["price"], "description": info["description"]}
     return None
 
-def list_all_fruits() -> list:
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, name, price, description FROM fruits ORDER BY id ASC")
-    fruits = cursor.fetchall()
-    conn.close()
-    return fruits
+async def list_all_fruits() -> list:
+    return await fruit_db.list_fruits()
+
+# === RECOGNITION CACHE ===
+recognition_cache: Optional[RecognitionCache] = None
+
+def init_recognition_cache():
+    global recognition_cache
+    recognition_cache = RecognitionCache(
+        CACHE_DB_PATH,
+        max_entries=CACHE_MAX_ENTRIES,
+        ttl=CACHE_TTL_SECONDS,
+        db_ttl=CACHE_DB_TTL_SECONDS,
+        phash_distance=CACHE_PHASH_DISTANCE,
+    )
+
+# === LOCAL CLASSIFIER ===
+local_classifier = LocalClassifier(
+    k=LOCAL_CLASSIFIER_K,
+    min_vote=LOCAL_CLASSIFIER_MIN_VOTE,
+    min_similarity=LOCAL_CLASSIFIER_MIN_SIMILARITY,
+)
+recognizer_counters = {"local_hits": 0, "gemini_calls": 0, "learned": 0}
+
+async def load_local_classifier():
+    local_classifier.load(await fruit_db.list_references())
+
+async def add_reference_image(fruit_id: int, features, source: str, max_per_source: int = 0):
+    ref_id, pruned = await fruit_db.add_reference(fruit_id, features_to_blob(features), source, max_per_source)
+    local_classifier.remove_references(pruned)
+    local_classifier.add(ref_id, fruit_id, features)
+
+async def learn_from_gemini(fruit_name: Optional[str], features) -> bool:
+    # Chỉ học khi nhãn Gemini khớp nguyên văn tên/bí danh trong catalog. Khớp bỏ dấu hay gần đúng
+    # có thể sai ("dừa" -> "dứa"), và ảnh tham chiếu sai sẽ bị bộ phân loại CPU lặp lại mãi.
+    fruit_id = catalog_index.find_exact_id(fruit_name) if fruit_name and features is not None else None
+    if fruit_id is None:
+        return False
+    with stage("db"):
+        await add_reference_image(fruit_id, features, "gemini", LOCAL_CLASSIFIER_MAX_LEARNED)
+    recognizer_counters["learned"] += 1
+    return True
 
 # === GEMINI ===
 def _build_gemini_request_body(image_b64: str, mime_type: str) -> dict:
@@ -80,33 +216,104 @@ def _build_gemini_request_body(image_b64: str, mime_type: str) -> dict:
         ]
     }
 
-def call_gemini_api(image_bytes: bytes, mime_type: str) -> Optional[str]:
-    if not GEMINI_API_KEY:
+def _build_gemini_batch_request_body(images: list) -> dict:
+    parts = [{"text": BATCH_PROMPT.format(count=len(images))}]
+    for idx, (image_bytes, mime_type) in enumerate(images, start=1):
+        parts.append({"text": f"Ảnh {idx}:"})
+        parts.append({"inline_data": {"mime_type": mime_type, "data": base64.b64encode(image_bytes).decode("ascii")}})
+    return {
+        "contents": [{"role": "user", "parts": parts}],
+        "generationConfig": {
+            "responseMimeType": "application/json",
+            "responseSchema": {"type": "ARRAY", "items": {"type": "STRING"}},
+        },
+    }
+
+def _response_text(data: dict) -> Optional[str]:
+    candidates = data.get("candidates", [])
+    if candidates:
+        parts = candidates[0].get("content", {}).get("parts", [])
+        for part in parts:
+            if "text" in part:
+                return part["text"]
+    return None
+
+gemini_client: Optional[GeminiClient] = None
+gemini_batcher: Optional[GeminiBatcher] = None
+
+def init_gemini_client():
+    global gemini_client, gemini_batcher
+    if GEMINI_API_KEY:
+        gemini_client = GeminiClient(
+            GEMINI_API_KEY,
+            GEMINI_MODEL,
+            base_url=GEMINI_BASE_URL,
+            max_concurrency=GEMINI_MAX_CONCURRENCY,
+            connect_timeout=GEMINI_CONNECT_TIMEOUT,
+            read_timeout=GEMINI_READ_TIMEOUT,
+            max_retries=GEMINI_MAX_RETRIES,
+            requests_per_minute=GEMINI_RPM,
+            hedge_model=GEMINI_HEDGE_MODEL,
+            hedge_percentile=GEMINI_HEDGE_PERCENTILE,
+        )
+    if gemini_client and GEMINI_BATCH_SIZE > 1:
+        gemini_batcher = GeminiBatcher(
+            call_gemini_api,
+            call_gemini_batch,
+            max_batch=GEMINI_BATCH_SIZE,
+            max_wait=GEMINI_BATCH_WAIT_MS / 1000,
+        )
+
+async def call_gemini_api(image_bytes: bytes, mime_type: str) -> Optional[str]:
+    if not gemini_client:
         return None
-    image_b64 = base64.b64encode(image_bytes).decode("utf-8")
-    body = _build_gemini_request_body(image_b64, mime_type)
-    params = {"key": GEMINI_API_KEY}
+    with stage("encode"):
+        image_b64 = base64.b64encode(image_bytes).decode("ascii")
+        body = _build_gemini_request_body(image_b64, mime_type)
     try:
-        response = requests.post(GEMINI_ENDPOINT, params=params, json=body, timeout=60)
-        response.raise_for_status()
-        data = response.json()
-        candidates = data.get("candidates", [])
-        if candidates:
-            parts = candidates[0].get("content", {}).get("parts", [])
-            for part in parts:
-                if "text" in part:
-                    return part["text"].strip().lower()
-    except Exception as e:
-        print("❌ Gemini API Error:", e)
+        with stage("gemini"):
+            data = await gemini_client.generate_content(body)
+        metrics.record_gemini_usage(data)
+        text = _response_text(data)
+        if text:
+            return text.strip().lower()
+    except Exception:
+        logger.exception("Gemini API error")
     return None
 
+async def call_gemini_batch(images: list) -> Optional[list]:
+    # Trả về None nếu kết quả không phải mảng JSON đúng số phần tử -> batcher gọi lại từng ảnh
+    with stage("encode"):
+        body = _build_gemini_batch_request_body(images)
+    with stage("gemini_batch"):
+        data = await gemini_client.generate_content(body)
+    metrics.record_gemini_usage(data)
+    text = _response_text(data)
+    try:
+        labels = json.loads(text or "")
+    except ValueError:
+        return None
+    if not isinstance(labels, list) or len(labels) != len(images):
+        return None
+    return [(label.strip().lower() or None) if isinstance(label, str) else None for label in labels]
+
+async def recognize_with_gemini(image_bytes: bytes, mime_type: str) -> Optional[str]:
+    if not gemini_batcher:
+        return await call_gemini_api(image_bytes, mime_type)
+    try:
+        return await gemini_batcher.submit(image_bytes, mime_type)
+    except Exception:
+        # Batch lỗi được chuyển cho mọi ảnh trong batch: xử lý như khi gọi lẻ (None -> "không nhận diện được")
+        logger.exception("Gemini batch error")
+        return None
+
 # === TELEGRAM HANDLERS ===
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     name = user.first_name or "bạn"
     try:
         if WELCOME_GIF_URL:
-            resp = requests.get(WELCOME_GIF_URL, timeout=20)
+            resp = await asyncio.to_thread(requests.get, WELCOME_GIF_URL, timeout=20)
             resp.raise_for_status()
             bio = io.BytesIO(resp.content)
             bio.name = "welcome.gif"
@@ -140,37 +347,170 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     await update.message.reply_text(help_text, parse_mode="Markdown")
 
-async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    status_msg = await update.message.reply_text("🔍 Đang nhận diện hình ảnh...")
-    try:
-        photo = update.message.photo[-1]
-        file = await context.bot.get_file(photo.file_id)
-        image_bytes = await file.download_as_bytearray()
-        fruit_name = await asyncio.to_thread(call_gemini_api, bytes(image_bytes), "image/jpeg")
-    except Exception:
-        await status_msg.edit_text("❌ Không thể tải ảnh hoặc xử lý.")
-        return
+def _image_source(message) -> Optional[tuple]:
+    # Trả về (file_id, file_unique_id, mime_type) cho ảnh gửi dạng photo hoặc document
+    if message.photo:
+        photo = select_photo_size(message.photo, IMAGE_MIN_SIDE)
+        return photo.file_id, photo.file_unique_id, "image/jpeg"
+    document = message.document
+    if document and document.mime_type in SUPPORTED_MIME_TYPES:
+        if document.file_size and document.file_size > MAX_DOCUMENT_BYTES:
+            return None
+        return document.file_id, document.file_unique_id, document.mime_type
+    return None
 
+async def recognize_image(bot, source: tuple) -> Optional[str]:
+    file_id, file_unique_id, mime_type = source
+    with stage("cache"):
+        fruit_name = await asyncio.to_thread(recognition_cache.get_by_file_id, file_unique_id)
+    if fruit_name:
+        return fruit_name
+    with stage("download"):
+        file = await bot.get_file(file_id)
+        image_bytes = await file.download_as_bytearray()
+    with stage("cache"):
+        fruit_name, cache_keys = await asyncio.to_thread(recognition_cache.get_by_content, image_bytes)
+    features = None
+    if not fruit_name and LOCAL_CLASSIFIER_ENABLED:
+        with stage("local_classifier"):
+            features = await asyncio.to_thread(extract_features, image_bytes)
+            if features is not None:
+                fruit_id, _confidence = await asyncio.to_thread(local_classifier.classify, features)
+                fruit = catalog_index.get(fruit_id) if fruit_id is not None else None
+                if fruit:
+                    recognizer_counters["local_hits"] += 1
+                    fruit_name = fruit["name"]
     if not fruit_name:
-        await status_msg.edit_text("⚠️ Không thể nhận diện loại trái cây này.")
-        return
+        with stage("preprocess"):
+            mime_type = sniff_mime_type(image_bytes, mime_type) or mime_type
+            image_bytes, mime_type = await asyncio.to_thread(
+                prepare_image, image_bytes, mime_type, IMAGE_MAX_SIDE, IMAGE_MAX_BYTES
+            )
+        recognizer_counters["gemini_calls"] += 1
+        fruit_name = await recognize_with_gemini(image_bytes, mime_type)
+        # Kết quả Gemini khớp sản phẩm trong catalog -> thêm làm ảnh tham chiếu cho bộ phân loại CPU
+        await learn_from_gemini(fruit_name, features)
+    if fruit_name:
+        with stage("cache"):
+            await asyncio.to_thread(recognition_cache.put, fruit_name, file_unique_id, cache_keys)
+    return fruit_name
 
+def format_result(fruit_name: Optional[str]) -> str:
+    if not fruit_name:
+        return "⚠️ Không thể nhận diện loại trái cây này."
     info = get_fruit_info(fruit_name)
     if info:
-        await status_msg.edit_text(
+        return (
             f"🍉 **Kết quả:** *{info['name'].capitalize()}*\n"
             f"💰 Giá: {info['price']}\n"
-            f"📖 Mô tả: {info['description']}",
-            parse_mode="Markdown"
-        )
-    else:
-        await status_msg.edit_text(
-            f"🙇‍♀️ Xin lỗi, sản phẩm *{fruit_name.capitalize()}* chưa có trong hệ thống.\n"
-            "🛒 Chúng tôi sẽ cập nhật sớm!",
-            parse_mode="Markdown"
+            f"📖 Mô tả: {info['description']}"
         )
+    return (
+        f"🙇‍♀️ Xin lỗi, sản phẩm *{fruit_name.capitalize()}* chưa có trong hệ thống.\n"
+        "🛒 Chúng tôi sẽ cập nhật sớm!"
+    )
+
+def format_image_result(result) -> str:
+    # Kết quả một ảnh trong job: tên trái cây, None, hoặc exception khi tải/xử lý ảnh lỗi
+    if isinstance(result, BaseException):
+        return "❌ Không thể tải ảnh hoặc xử lý."
+    return format_result(result)
+
+# === RECOGNITION SCHEDULER ===
+recognition_scheduler: Optional[RecognitionScheduler] = None
+pending_albums: dict = {}
+
+def init_recognition_scheduler():
+    global recognition_scheduler
+    recognition_scheduler = RecognitionScheduler(
+        max_concurrency=SCHED_MAX_CONCURRENCY,
+        user_rate_per_minute=USER_RATE_PER_MINUTE,
+        user_burst=USER_BURST,
+        max_queue=SCHED_MAX_QUEUE,
+    )
+    recognition_scheduler.start()
+
+async def _collect_album(message) -> Optional[list]:
+    # Ảnh đầu tiên của album chờ gom các ảnh còn lại; các ảnh sau chỉ được thêm vào danh sách
+    key = (message.chat_id, message.media_group_id)
+    if key in pending_albums:
+        pending_albums[key].append(message)
+        return None
+    pending_albums[key] = [message]
+    await asyncio.sleep(ALBUM_WAIT_SECONDS)
+    return sorted(pending_albums.pop(key), key=lambda m: m.message_id)
+
+async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    timings = metrics.start_request(update.update_id)
+    metrics.UPDATES.inc(handler="photo")
+    message = update.message
+    messages = [message]
+    if message.media_group_id:
+        messages = await _collect_album(message)
+        if not messages:
+            return
+    sources = [source for source in map(_image_source, messages) if source]
+    if not sources:
+        await message.reply_text("⚠️ Định dạng ảnh không được hỗ trợ (chỉ nhận JPEG, PNG, WEBP, HEIC, tối đa 20MB).")
+        return
+
+    async def job():
+        # Chạy song song để các ảnh của album được gom chung một request Gemini;
+        # một ảnh lỗi (tải về thất bại...) không làm mất kết quả của các ảnh khác
+        return await asyncio.gather(*(recognize_image(context.bot, source) for source in sources),
+                                    return_exceptions=True)
+
+    user_id = update.effective_user.id
+    try:
+        # Album tính theo số ảnh, cả khi xét giới hạn lẫn khi chia lượt round-robin
+        future = recognition_scheduler.submit(user_id, job, priority=user_id == ADMIN_ID, weight=len(sources))
+    except RateLimitedError as e:
+        metrics.ERRORS.inc(stage="admission", cause="rate_limited")
+        await message.reply_text(f"⏳ Bạn gửi ảnh hơi nhanh, vui lòng thử lại sau {max(1, round(e.retry_after))} giây nhé!")
+        return
+    except QueueFullError:
+        metrics.ERRORS.inc(stage="admission", cause="queue_full")
+        await message.reply_text("🚦 Hệ thống đang bận, vui lòng gửi lại ảnh sau ít phút nhé!")
+        return
+
+    with stage("reply"):
+        status_msg = await message.reply_text("🔍 Đang nhận diện hình ảnh...")
+    try:
+        with stage("recognize"):
+            results = await future
+    except Exception:
+        logger.exception("Photo recognition failed", extra={"fields": {"stages": timings}})
+        await status_msg.edit_text("❌ Không thể tải ảnh hoặc xử lý.")
+        return
+    for error in results:
+        if isinstance(error, BaseException):
+            logger.error("Image recognition failed", exc_info=error, extra={"fields": {"stages": timings}})
+
+    with stage("reply"):
+        if len(results) == 1:
+            await status_msg.edit_text(format_image_result(results[0]), parse_mode="Markdown")
+        else:
+            replies = [f"🖼️ *Ảnh {idx}:*\n{format_image_result(result)}" for idx, result in enumerate(results, start=1)]
+            await status_msg.edit_text("\n\n".join(replies), parse_mode="Markdown")
+    logger.info("Photo handled", extra={"fields": {
+        "user_id": user_id, "images": len(sources), "stages": timings,
+        "labels": [None if isinstance(result, BaseException) else result for result in results],
+    }})
 
 # === ADMIN FUNCTIONS ===
+def instrumented(name: str):
+    # Gắn correlation ID, đếm update và đo tổng thời gian của handler admin
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
+            metrics.start_request(update.update_id)
+            metrics.UPDATES.inc(handler=name)
+            with stage(f"admin_{name}"):
+                return await handler(update, context)
+        return wrapper
+    return decorator
+
+@instrumented("admin")
 async def admin_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.effective_user.id != ADMIN_ID:
         await update.message.reply_text("🚫 Bạn không có quyền truy cập.")
@@ -180,10 +520,16 @@ async def admin_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "/addfruit - Thêm trái cây mới\n"
         "/updatefruit - Cập nhật thông tin\n"
         "/deletefruit - Xóa sản phẩm\n"
-        "/listfruits - Xem danh sách tất cả\n"
+        "/listfruits [từ khoá] - Xem/tìm danh sách (lật trang, sắp theo tên/giá)\n"
+        "/exportfruits [csv|json] - Xuất toàn bộ catalog\n"
+        "/importfruits - Gửi/reply file CSV hoặc JSON để nhập hàng loạt\n"
+        "/addalias - Thêm bí danh cho sản phẩm\n"
+        "/addref - Reply ảnh để thêm ảnh tham chiếu\n"
+        "/stats - Thống kê hệ thống\n"
     )
     await update.message.reply_text(menu, parse_mode="Markdown")
 
+@instrumented("addfruit")
 async def add_fruit(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.effective_user.id != ADMIN_ID:
         return await update.message.reply_text("🚫 Bạn không có quyền này.")
@@ -192,15 +538,15 @@ async def add_fruit(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if len(args) < 3:
             return await update.message.reply_text("📌 Cú pháp: /addfruit <tên> <giá> <mô tả>")
         name, price, description = args[0], args[1], " ".join(args[2:])
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("INSERT OR IGNORE INTO fruits (name, price, description) VALUES (?, ?, ?)", (name, price, description))
-        conn.commit()
-        conn.close()
+        with stage("db"):
+            row = await fruit_db.add_fruit(name, price, description)
+        if row:
+            catalog_index.upsert(*row)
         await update.message.reply_text(f"✅ Đã thêm sản phẩm *{name}* thành công!", parse_mode="Markdown")
     except Exception as e:
         await update.message.reply_text(f"❌ Lỗi thêm sản phẩm: {e}")
 
+@instrumented("updatefruit")
 async def update_fruit(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.effective_user.id != ADMIN_ID:
         return await update.message.reply_text("🚫 Không có quyền.")
@@ -209,15 +555,15 @@ async def update_fruit(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if len(args) < 3:
             return await update.message.reply_text("📌 Cú pháp: /updatefruit <tên> <giá> <mô tả>")
         name, price, description = args[0], args[1], " ".join(args[2:])
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("UPDATE fruits SET price=?, description=? WHERE LOWER(name)=?", (price, description, name.lower()))
-        conn.commit()
-        conn.close()
+        with stage("db"):
+            row = await fruit_db.update_fruit(name, price, description)
+        if row:
+            catalog_index.upsert(*row)
         await update.message.reply_text(f"✏️ Đã cập nhật sản phẩm *{name}*!", parse_mode="Markdown")
     except Exception as e:
         await update.message.reply_text(f"❌ Lỗi cập nhật: {e}")
 
+@instrumented("deletefruit")
 async def delete_fruit(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.effective_user.id != ADMIN_ID:
         return await update.message.reply_text("🚫 Không có quyền.")
@@ -226,34 +572,307 @@ async def delete_fruit(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if not args:
             return await update.message.reply_text("📌 Cú pháp: /deletefruit <tên>")
         name = " ".join(args)
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM fruits WHERE LOWER(name)=?", (name.lower(),))
-        conn.commit()
-        conn.close()
+        with stage("db"):
+            deleted_ids = await fruit_db.delete_fruit(name)
+        for fruit_id in deleted_ids:
+            catalog_index.remove(fruit_id)
+            local_classifier.remove_fruit(fruit_id)
         await update.message.reply_text(f"🗑️ Đã xóa sản phẩm *{name}*!", parse_mode="Markdown")
     except Exception as e:
         await update.message.reply_text(f"❌ Lỗi xóa: {e}")
 
+@instrumented("addalias")
+async def add_alias(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id != ADMIN_ID:
+        return await update.message.reply_text("🚫 Không có quyền.")
+    try:
+        args = context.args
+        if len(args) < 2:
+            return await update.message.reply_text("📌 Cú pháp: /addalias <tên> <bí danh>")
+        name, alias = args[0], normalize_name(" ".join(args[1:]))
+        fruit_id = catalog_index.find_id(name)
+        if fruit_id is None:
+            return await update.message.reply_text(f"⚠️ Không tìm thấy sản phẩm *{name}*.", parse_mode="Markdown")
+        with stage("db"):
+            await fruit_db.add_alias(alias, fruit_id)
+        catalog_index.add_alias(alias, fruit_id)
+        await update.message.reply_text(f"🔗 Đã thêm bí danh *{alias}* cho *{name}*!", parse_mode="Markdown")
+    except Exception as e:
+        await update.message.reply_text(f"❌ Lỗi thêm bí danh: {e}")
+
+@instrumented("addref")
+async def add_reference(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id != ADMIN_ID:
+        return await update.message.reply_text("🚫 Không có quyền.")
+    try:
+        args = context.args
+        replied = update.message.reply_to_message
+        source = _image_source(replied) if replied else None
+        if not args or not source:
+            return await update.message.reply_text("📌 Cú pháp: trả lời (reply) một ảnh bằng /addref <tên>")
+        name = " ".join(args)
+        fruit_id = catalog_index.find_id(name)
+        if fruit_id is None:
+            return await update.message.reply_text(f"⚠️ Không tìm thấy sản phẩm *{name}*.", parse_mode="Markdown")
+        with stage("download"):
+            file = await context.bot.get_file(source[0])
+            image_bytes = await file.download_as_bytearray()
+        features = await asyncio.to_thread(extract_features, image_bytes)
+        if features is None:
+            return await update.message.reply_text("⚠️ Không đọc được ảnh này.")
+        with stage("db"):
+            await add_reference_image(fruit_id, features, "admin")
+        await update.message.reply_text(
+            f"🖼️ Đã thêm ảnh tham chiếu cho *{name}* (tổng {len(local_classifier)} ảnh)!", parse_mode="Markdown"
+        )
+    except Exception as e:
+        await update.message.reply_text(f"❌ Lỗi thêm ảnh tham chiếu: {e}")
+
+# --- Danh sách phân trang ---
+# Trạng thái trang lưu trong user_data, callback_data chỉ mang hành động (giới hạn 64 byte)
+SORT_LABELS = {"name": "🔤 Tên", "price": "💰 Giá"}
+
+async def _load_catalog_page(state: dict, direction: Optional[str] = None) -> list:
+    limit = CATALOG_PAGE_SIZE
+    if direction == "next":
+        rows = await fruit_db.page_fruits(state["sort"], state["search"], after=state["last"], limit=limit + 1)
+        state["has_prev"], state["has_next"] = True, len(rows) > limit
+        rows = rows[:limit]
+    elif direction == "prev":
+        rows = await fruit_db.page_fruits(state["sort"], state["search"], before=state["first"], limit=limit + 1)
+        state["has_prev"], state["has_next"] = len(rows) > limit, True
+        rows = rows[-limit:]
+    else:
+        rows = []
+    if not rows:
+        # Trang đầu, hoặc trang cũ không còn dữ liệu (sản phẩm vừa bị xoá)
+        rows = await fruit_db.page_fruits(state["sort"], state["search"], limit=limit + 1)
+        state["has_prev"], state["has_next"], state["page"] = False, len(rows) > limit, 1
+        rows = rows[:limit]
+    elif direction:
+        state["page"] += 1 if direction == "next" else -1
+    if rows:
+        state["first"], state["last"] = (rows[0][4], rows[0][0]), (rows[-1][4], rows[-1][0])
+    return rows
+
+def _format_catalog_page(state: dict, rows: list) -> str:
+    pages = max(1, math.ceil(state["total"] / CATALOG_PAGE_SIZE))
+    title = "📋 *Danh sách trái cây*"
+    if state["search"]:
+        title += f" — tìm \"{escape_markdown(state['search'])}\""
+    msg = f"{title}\n{state['total']} sản phẩm · trang {state['page']}/{pages}\n\n"
+    start = (state["page"] - 1) * CATALOG_PAGE_SIZE
+    for idx, (_fid, name, price, desc, _key) in enumerate(rows, start=start + 1):
+        desc = desc or ""
+        if len(desc) > 150:
+            desc = desc[:150].rstrip() + "…"
+        msg += f"{idx}. *{escape_markdown(name)}* — 💰 {escape_markdown(price or '')}\n📖 {escape_markdown(desc)}\n\n"
+    return msg
+
+def _catalog_keyboard(state: dict) -> InlineKeyboardMarkup:
+    nav = []
+    if state["has_prev"]:
+        nav.append(InlineKeyboardButton("◀️ Trước", callback_data="catalog:prev"))
+    if state["has_next"]:
+        nav.append(InlineKeyboardButton("Sau ▶️", callback_data="catalog:next"))
+    sort = [
+        InlineKeyboardButton(("✅ " if key == state["sort"] else "") + label, callback_data=f"catalog:sort:{key}")
+        for key, label in SORT_LABELS.items()
+    ]
+    return InlineKeyboardMarkup([nav, sort] if nav else [sort])
+
+@instrumented("listfruits")
 async def list_fruits(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.effective_user.id != ADMIN_ID:
         return await update.message.reply_text("🚫 Không có quyền.")
-    fruits = list_all_fruits()
-    if not fruits:
-        await update.message.reply_text("📭 Chưa có sản phẩm nào.")
-        return
-    msg = "📋 *Danh sách trái cây:*\n\n"
-    for idx, (_fid, name, price, desc) in enumerate(fruits, start=1):
-        msg += f"{idx}. *{name}* — 💰 {price}\n📖 {desc}\n\n"
+    state = {"sort": "name", "search": " ".join(context.args) or None}
+    with stage("db"):
+        state["total"] = await fruit_db.count_fruits(state["search"])
+        rows = await _load_catalog_page(state)
+    if not rows:
+        msg = "📭 Không tìm thấy sản phẩm nào." if state["search"] else "📭 Chưa có sản phẩm nào."
+        return await update.message.reply_text(msg)
+    context.user_data["catalog"] = state
+    await update.message.reply_text(
+        _format_catalog_page(state, rows), parse_mode="Markdown", reply_markup=_catalog_keyboard(state)
+    )
+
+@instrumented("catalog_page")
+async def catalog_page(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    if update.effective_user.id != ADMIN_ID:
+        return await query.answer("🚫 Không có quyền.", show_alert=True)
+    state = context.user_data.get("catalog")
+    if not state:
+        await query.answer()
+        return await query.edit_message_text("⌛ Danh sách đã hết hạn, gõ /listfruits để xem lại.")
+    action = query.data.split(":")[1:]
+    direction = None
+    if action[0] == "sort":
+        if action[1] == state["sort"] or action[1] not in SORT_LABELS:
+            return await query.answer()
+        state["sort"] = action[1]
+    elif action[0] in ("next", "prev"):
+        direction = action[0]
+    await query.answer()
+    with stage("db"):
+        state["total"] = await fruit_db.count_fruits(state["search"])
+        rows = await _load_catalog_page(state, direction)
+    if not rows:
+        return await query.edit_message_text("📭 Chưa có sản phẩm nào.")
+    await query.edit_message_text(
+        _format_catalog_page(state, rows), parse_mode="Markdown", reply_markup=_catalog_keyboard(state)
+    )
+
+# --- Nhập/xuất hàng loạt ---
+@instrumented("exportfruits")
+async def export_fruits(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id != ADMIN_ID:
+        return await update.message.reply_text("🚫 Không có quyền.")
+    fmt = context.args[0].lower() if context.args else "csv"
+    if fmt not in ("csv", "json"):
+        return await update.message.reply_text("📌 Cú pháp: /exportfruits [csv|json]")
+    try:
+        with stage("db"):
+            data = await fruit_db.export_fruits(write_csv if fmt == "csv" else write_json)
+            total = await fruit_db.count_fruits()
+        await update.message.reply_document(
+            InputFile(io.BytesIO(data), filename=f"fruits.{fmt}"), caption=f"📦 Đã xuất {total} sản phẩm."
+        )
+    except Exception as e:
+        await update.message.reply_text(f"❌ Lỗi xuất catalog: {e}")
+
+@instrumented("importfruits")
+async def import_fruits(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id != ADMIN_ID:
+        return await update.message.reply_text("🚫 Không có quyền.")
+    message = update.message
+    document = message.document or (message.reply_to_message.document if message.reply_to_message else None)
+    fmt = detect_format(document.file_name, document.mime_type) if document else None
+    if not fmt:
+        return await message.reply_text(
+            "📌 Cú pháp: gửi file .csv/.json/.jsonl kèm chú thích /importfruits, hoặc reply file đó bằng /importfruits\n"
+            "Cột: name, price, description, aliases (bí danh cách nhau bằng |)"
+        )
+    if document.file_size and document.file_size > CATALOG_IMPORT_MAX_BYTES:
+        return await message.reply_text(f"⚠️ File quá lớn (tối đa {CATALOG_IMPORT_MAX_BYTES // 1024} KB).")
+    try:
+        with stage("download"):
+            file = await context.bot.get_file(document.file_id)
+            data = await file.download_as_bytearray()
+        rows, errors = await asyncio.to_thread(parse_catalog, bytes(data), fmt)
+        result = {"inserted": 0, "updated": 0, "fruits": [], "aliases": []}
+        if rows:
+            with stage("db"):
+                result = await fruit_db.import_fruits(rows)
+            await apply_catalog_changes(result["fruits"], result["aliases"])
+        msg = (
+            "📥 *Kết quả nhập catalog*\n\n"
+            f"➕ Thêm mới: {result['inserted']}\n"
+            f"✏️ Cập nhật: {result['updated']}\n"
+            f"🔗 Bí danh: {len(result['aliases'])}\n"
+            f"⚠️ Bỏ qua: {len(errors)}\n"
+        )
+        if errors:
+            msg += "\n" + "\n".join(escape_markdown(error) for error in errors[:10])
+            if len(errors) > 10:
+                msg += f"\n… và {len(errors) - 10} lỗi khác"
+        await message.reply_text(msg, parse_mode="Markdown")
+    except Exception as e:
+        await message.reply_text(f"❌ Lỗi nhập catalog: {e}")
+
+@instrumented("stats")
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id != ADMIN_ID:
+        return await update.message.reply_text("🚫 Không có quyền.")
+    cache = recognition_cache.stats()
+    sched = recognition_scheduler.stats()
+    msg = (
+        "📊 *Thống kê cache nhận diện*\n\n"
+        f"✅ Hit (bộ nhớ): {cache['hits_memory']}\n"
+        f"✅ Hit (SQLite): {cache['hits_sqlite']}\n"
+        f"✅ Hit (ảnh gần giống): {cache['hits_phash']}\n"
+        f"❌ Miss: {cache['misses']}\n"
+        f"📈 Tỉ lệ hit: {cache['hit_rate']:.1%}\n"
+        f"🗂️ Số mục trong bộ nhớ: {cache['memory_entries']}\n\n"
+        "🚦 *Hàng đợi nhận diện*\n\n"
+        f"📥 Đang chờ: {sched['queue_depth']} (cao nhất {sched['max_depth']})\n"
+        f"⚙️ Đang xử lý: {sched['running']}\n"
+        f"✅ Hoàn thành: {sched['completed']} | ❌ Lỗi: {sched['failed']}\n"
+        f"⛔ Từ chối: {sched['rejected_queue_full']} (đầy) / {sched['rejected_rate_limited']} (quá nhanh)\n"
+        f"⏱️ Thời gian chờ p50/p95/max: {sched['wait_p50']:.2f}s / {sched['wait_p95']:.2f}s / {sched['wait_max']:.2f}s\n"
+    )
+    msg += (
+        "\n🧠 *Nhận diện*\n\n"
+        f"💻 Trả lời bằng bộ phân loại CPU: {recognizer_counters['local_hits']}\n"
+        f"☁️ Chuyển lên Gemini: {recognizer_counters['gemini_calls']}\n"
+        f"📚 Ảnh tham chiếu: {len(local_classifier)} (học thêm {recognizer_counters['learned']})\n"
+    )
+    if gemini_batcher:
+        batch = gemini_batcher.stats()
+        msg += (
+            "\n📦 *Gom ảnh Gemini*\n\n"
+            f"🖼️ Ảnh: {batch['images']} | Batch: {batch['batches']} | Gọi lẻ: {batch['single_calls']}\n"
+            f"↩️ Batch không đọc được, gọi lại từng ảnh: {batch['fallbacks']} | ❌ Batch lỗi: {batch['errors']}\n"
+        )
     await update.message.reply_text(msg, parse_mode="Markdown")
 
 # === MAIN ===
-def main():
-    init_db()
+metrics_server = None
+
+def register_gauges():
+    metrics.gauge("bot_queue_depth", "Số job nhận diện đang chờ", lambda: recognition_scheduler.stats()["queue_depth"])
+    metrics.gauge("bot_queue_running", "Số job nhận diện đang chạy", lambda: recognition_scheduler.stats()["running"])
+    metrics.gauge("bot_queue_wait_p95_seconds", "Thời gian chờ p95 trong hàng đợi", lambda: recognition_scheduler.stats()["wait_p95"])
+    metrics.counter("bot_queue_rejected_total", "Số job bị từ chối", lambda: (
+        recognition_scheduler.stats()["rejected_queue_full"] + recognition_scheduler.stats()["rejected_rate_limited"]
+    ))
+    metrics.gauge("bot_cache_hit_rate", "Tỉ lệ hit cache nhận diện", lambda: recognition_cache.stats()["hit_rate"])
+    metrics.counter("bot_local_classifier_hits_total", "Số ảnh trả lời bằng bộ phân loại CPU", lambda: recognizer_counters["local_hits"])
+    metrics.counter("bot_gemini_escalations_total", "Số ảnh chuyển lên Gemini", lambda: recognizer_counters["gemini_calls"])
+
+async def post_init(app):
+    global metrics_server
+    await init_db()
+    await load_catalog_index()
+    await load_local_classifier()
+    init_gemini_client()
+    init_recognition_scheduler()
+    if METRICS_ENABLED:
+        register_gauges()
+        if METRICS_PORT:
+            try:
+                metrics_server = await metrics.start_http_server(METRICS_HOST, METRICS_PORT)
+                logger.info("Metrics endpoint at http://%s:%s/metrics", METRICS_HOST, METRICS_PORT)
+            except OSError as e:
+                # Cổng bận không được làm bot dừng hẳn: chỉ mất endpoint metrics
+                logger.error("Cannot start metrics endpoint on %s:%s: %s", METRICS_HOST, METRICS_PORT, e)
+
+async def post_shutdown(app):
+    if metrics_server:
+        metrics_server.close()
+    if recognition_scheduler:
+        await recognition_scheduler.stop()
+    if gemini_batcher:
+        await gemini_batcher.aclose()
+    if gemini_client:
+        await gemini_client.aclose()
+    fruit_db.close()
+
+def build_application():
     if not TELEGRAM_BOT_TOKEN:
         raise RuntimeError("Thiếu TELEGRAM_BOT_TOKEN trong .env")
 
-    app = ApplicationBuilder().token(TELEGRAM_BOT_TOKEN).build()
+    app = (
+        ApplicationBuilder()
+        .token(TELEGRAM_BOT_TOKEN)
+        .base_url(TELEGRAM_API_BASE_URL)
+        .base_file_url(TELEGRAM_FILE_BASE_URL)
+        .concurrent_updates(CONCURRENT_UPDATES)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CommandHandler("help", help_command))
     app.add_handler(CommandHandler("admin", admin_menu))
@@ -261,10 +880,51 @@ def main():
     app.add_handler(CommandHandler("updatefruit", update_fruit))
     app.add_handler(CommandHandler("deletefruit", delete_fruit))
     app.add_handler(CommandHandler("listfruits", list_fruits))
-    app.add_handler(MessageHandler(filters.PHOTO & ~filters.COMMAND, handle_photo))
+    app.add_handler(CallbackQueryHandler(catalog_page, pattern=r"^catalog:"))
+    app.add_handler(CommandHandler("exportfruits", export_fruits))
+    app.add_handler(CommandHandler("importfruits", import_fruits))
+    app.add_handler(MessageHandler(
+        filters.Document.ALL & filters.CaptionRegex(r"^/importfruits(@\w+)?(\s|$)"), import_fruits
+    ))
+    app.add_handler(CommandHandler("addalias", add_alias))
+    app.add_handler(CommandHandler("addref", add_reference))
+    app.add_handler(CommandHandler("stats", stats_command))
+    app.add_handler(MessageHandler((filters.PHOTO | filters.Document.IMAGE) & ~filters.COMMAND, handle_photo))
+    return app
 
-    print("🤖 Bot PMSshop đang chạy... (Admin có thể thêm/sửa/xóa sản phẩm)")
-    app.run_polling()
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="PMSshop - bot nhận diện trái cây")
+    parser.add_argument("--mode", choices=["polling", "webhook"], default=BOT_MODE)
+    parser.add_argument("--host", default=WEBHOOK_LISTEN, help="Địa chỉ lắng nghe webhook")
+    parser.add_argument("--port", type=int, default=WEBHOOK_PORT, help="Cổng lắng nghe webhook")
+    parser.add_argument("--path", default=WEBHOOK_PATH, help="Đường dẫn webhook")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    metrics.enabled = METRICS_ENABLED
+    metrics.setup_logging(json_logs=LOG_FORMAT == "json")
+    init_recognition_cache()
+    app = build_application()
+
+    # Khi dừng (SIGINT/SIGTERM), Application.stop() chờ các update đang xử lý song song
+    # hoàn tất trước khi gọi post_shutdown -> không mất ảnh đang nhận diện dở.
+    if args.mode == "webhook":
+        if not WEBHOOK_URL or not WEBHOOK_SECRET:
+            raise RuntimeError("Chế độ webhook cần WEBHOOK_URL và WEBHOOK_SECRET trong .env")
+        path = args.path.strip("/")
+        print(f"🤖 Bot PMSshop đang chạy (webhook) tại {args.host}:{args.port}/{path}")
+        app.run_webhook(
+            listen=args.host,
+            port=args.port,
+            url_path=path,
+            webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{path}",
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=Update.ALL_TYPES,
+        )
+    else:
+        print("🤖 Bot PMSshop đang chạy... (Admin có thể thêm/sửa/xóa sản phẩm)")
+        app.run_polling(allowed_updates=Update.ALL_TYPES)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,90 @@
+import pytest
+
+from catalog_index import CatalogIndex, edit_distance, normalize_name
+from fruit_db import DEFAULT_FRUITS
+
+
+@pytest.fixture
+def index():
+    catalog = CatalogIndex(fold_diacritics=True, max_distance=2)
+    catalog.load([(i, name, price, desc) for i, (name, price, desc) in enumerate(DEFAULT_FRUITS, start=1)])
+    return catalog
+
+
+def name_of(catalog, text):
+    info = catalog.lookup(text)
+    return info["name"] if info else None
+
+
+def test_normalize_name_strips_classifier_words_and_punctuation():
+    assert normalize_name("  Quả  Chuối! ") == "chuối"
+    assert normalize_name("trái thanh_long") == "thanh long"
+    assert normalize_name("quả") == "quả"
+    assert normalize_name("Trái Dứa", fold_diacritics=True) == "dua"
+
+
+def test_edit_distance_stops_early():
+    assert edit_distance("chuoi", "chuoi", 2) == 0
+    assert edit_distance("chuoi", "chuo", 2) == 1
+    assert edit_distance("chuoi", "xoai", 1) == 2
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("chuối", "chuối"),
+    ("quả chuối", "chuối"),
+    ("chuoi", "chuối"),
+    ("trai thanh long", "thanh long"),
+    ("thanh longg", "thanh long"),
+    ("thanh lonng", "thanh long"),
+    ("xoaii", "xoài"),
+    ("dua hau", "dưa hấu"),
+])
+def test_lookup_matches(index, query, expected):
+    assert name_of(index, query) == expected
+
+
+@pytest.mark.parametrize("query", [
+    "dừa", "dưa", "dưa lưới", "dưa leo", "táo tàu", "cam sành", "dâu tằm", "dau tam", "cau", "lê ki ma",
+])
+def test_lookup_does_not_merge_different_fruits(index, query):
+    assert name_of(index, query) is None
+
+
+def test_folded_collision_is_ambiguous(index):
+    # "dua" là cả "dứa" lẫn "dừa" khi bỏ dấu -> không đoán
+    index.upsert(100, "dừa", "15.000đ/quả", "Dừa xiêm")
+    assert name_of(index, "dừa") == "dừa"
+    assert name_of(index, "dứa") == "dứa"
+    assert name_of(index, "dua") is None
+    index.remove(100)
+    assert name_of(index, "dua") == "dứa"
+
+
+def test_alias_and_update(index):
+    index.add_alias("thơm", 7)
+    assert name_of(index, "thơm") == "dứa"
+    assert index.find_exact_id("thom") is None
+    index.upsert(7, "khóm", "30.000đ/kg", "")
+    assert name_of(index, "thơm") == "khóm"
+    assert name_of(index, "dứa") is None
+    index.remove(7)
+    assert name_of(index, "thơm") is None
+
+
+def test_price_only_update_keeps_keys(index):
+    index.upsert(1, "chuối", "30.000đ/kg", "Chuối mới")
+    info = index.lookup("chuoi")
+    assert (info["price"], info["description"]) == ("30.000đ/kg", "Chuối mới")
+    index.upsert(1, "chuối sứ", "30.000đ/kg", "")
+    assert name_of(index, "chuối sứ") == "chuối sứ"
+    assert index.find_id("chuối") is None
+
+
+def test_alias_moved_to_another_fruit(index):
+    index.add_alias("thơm", 7)
+    index.add_alias("thơm", 2)
+    assert index._keys["thơm"] == index._keys["thom"] == {2}
+    assert name_of(index, "thom") == "táo"
+    index.remove(2)
+    assert name_of(index, "thơm") is None
+    assert name_of(index, "dứa") == "dứa"
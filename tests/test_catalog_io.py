@@ -0,0 +1,93 @@
+import asyncio
+import json
+
+import pytest
+
+import catalog_io
+from fruit_db import FruitDB
+
+
+@pytest.mark.parametrize("filename, mime_type, expected", [
+    ("fruits.CSV", None, "csv"),
+    ("fruits.json", None, "json"),
+    ("fruits.ndjson", None, "jsonl"),
+    ("upload", "text/csv", "csv"),
+    ("upload", "application/json", "json"),
+    ("fruits.xlsx", None, None),
+])
+def test_detect_format(filename, mime_type, expected):
+    assert catalog_io.detect_format(filename, mime_type) == expected
+
+
+def test_parse_csv_with_bom_and_aliases():
+    data = "name,price,description,aliases\nSầu riêng,80.000đ/kg,Ri6,sầu ri6|durian\n".encode("utf-8-sig")
+    rows, errors = catalog_io.parse_catalog(data, "csv")
+    assert errors == []
+    assert rows == [{"name": "Sầu riêng", "price": "80.000đ/kg", "description": "Ri6",
+                     "aliases": ["sầu ri6", "durian"]}]
+
+
+def test_parse_reports_errors_per_line():
+    data = "\n".join([
+        json.dumps({"name": "Táo", "price": "30k"}),
+        "{không phải json",
+        json.dumps({"name": "", "price": "10k"}),
+        json.dumps({"name": "táo", "price": "31k"}),
+        json.dumps({"name": "Cam", "price": ""}),
+    ]).encode()
+    rows, errors = catalog_io.parse_catalog(data, "jsonl")
+    assert [row["name"] for row in rows] == ["Táo"]
+    assert [error.split(":")[0] for error in errors] == ["dòng 2", "dòng 3", "dòng 4", "dòng 5"]
+    assert "trùng tên với dòng 1" in errors[2]
+
+
+def test_parse_rejects_bad_aliases_per_line():
+    data = "\n".join([
+        json.dumps({"name": "Táo", "price": "30k", "aliases": 5}),
+        json.dumps({"name": "Cam", "price": "20k", "aliases": {"a": 1}}),
+        json.dumps({"name": "Lê", "price": "40k", "aliases": ["lê hàn"]}),
+    ]).encode()
+    rows, errors = catalog_io.parse_catalog(data, "jsonl")
+    assert [row["name"] for row in rows] == ["Lê"]
+    assert [error.split(":")[0] for error in errors] == ["dòng 1", "dòng 2"]
+
+
+def test_unreadable_file_returns_no_rows():
+    lines = ["name,price"] + [f"trái {i},{i}k" for i in range(2000)]
+    data = "\n".join(lines).encode()
+    data = data[:len(data) // 2] + b"\xff" + data[len(data) // 2:]
+    rows, errors = catalog_io.parse_catalog(data, "csv")
+    assert rows == []
+    assert len(errors) == 1 and "không đọc được file" in errors[0]
+
+
+def test_parse_rejects_non_list_json():
+    rows, errors = catalog_io.parse_catalog('{"name": "Táo"}'.encode(), "json")
+    assert rows == [] and len(errors) == 1
+
+
+@pytest.mark.parametrize("fmt, writer", [("csv", catalog_io.write_csv), ("json", catalog_io.write_json)])
+def test_export_import_round_trip(tmp_path, fmt, writer):
+    source = [
+        {"name": "Dưa lưới", "price": "45.000đ/kg", "description": "Ngọt, giòn", "aliases": ["dưa vàng"]},
+        {"name": "Bưởi", "price": "liên hệ", "description": "", "aliases": []},
+    ]
+
+    async def scenario():
+        first, second = FruitDB(str(tmp_path / "a.db")), FruitDB(str(tmp_path / "b.db"))
+        try:
+            await first.migrate()
+            await second.migrate()
+            await first.import_fruits(source)
+            data = await first.export_fruits(writer)
+            rows, errors = catalog_io.parse_catalog(data, fmt)
+            assert errors == []
+            result = await second.import_fruits(rows)
+            return result, await second.export_fruits(writer), data
+        finally:
+            first.close()
+            second.close()
+
+    result, exported_again, exported = asyncio.run(scenario())
+    assert result["inserted"] == 2
+    assert exported_again == exported
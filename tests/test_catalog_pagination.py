@@ -0,0 +1,106 @@
+import asyncio
+
+import pytest
+
+from fruit_db import FruitDB
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+# Giá trùng nhau và giá không đọc được (price_value NULL) là hai chỗ keyset dễ sai
+PRICES = ["liên hệ", "20.000đ", "hết hàng", "20.000đ", "15k", "liên hệ", "1.5tr", "20.000đ", "theo mùa", "9k", "15k"]
+
+
+@pytest.fixture
+def db(tmp_path):
+    database = FruitDB(str(tmp_path / "fruits.db"))
+    run(database.migrate())
+    run(database.import_fruits([
+        {"name": f"trái {i:02d}", "price": price, "description": ""} for i, price in enumerate(PRICES)
+    ]))
+    yield database
+    database.close()
+
+
+def expected_order(db, sort):
+    rows = run(db.page_fruits(sort, limit=100))
+    return [row[0] for row in rows]
+
+
+def walk_forward(db, sort, limit):
+    pages, after = [], None
+    while True:
+        rows = run(db.page_fruits(sort, after=after, limit=limit))
+        if not rows:
+            return pages
+        pages.append([row[0] for row in rows])
+        after = (rows[-1][4], rows[-1][0])
+
+
+def test_full_listing_puts_null_prices_first(db):
+    rows = run(db.page_fruits("price", limit=100))
+    keys = [row[4] for row in rows]
+    nulls = keys.count(None)
+    assert nulls == 4
+    assert keys[nulls:] == sorted(keys[nulls:])
+    assert all(key is None for key in keys[:nulls])
+
+
+@pytest.mark.parametrize("sort", ["price", "name"])
+@pytest.mark.parametrize("limit", [1, 2, 3, 4])
+def test_next_pages_cover_every_row_once(db, sort, limit):
+    pages = walk_forward(db, sort, limit)
+    assert [fruit_id for page in pages for fruit_id in page] == expected_order(db, sort)
+
+
+@pytest.mark.parametrize("sort", ["price", "name"])
+@pytest.mark.parametrize("limit", [1, 2, 3, 4])
+def test_prev_returns_the_previous_page(db, sort, limit):
+    pages = walk_forward(db, sort, limit)
+    rows_by_id = {row[0]: row for row in run(db.page_fruits(sort, limit=100))}
+    for previous, current in zip(pages, pages[1:]):
+        first = rows_by_id[current[0]]
+        rows = run(db.page_fruits(sort, before=(first[4], first[0]), limit=limit))
+        assert [row[0] for row in rows] == previous
+
+
+def test_prev_from_first_page_is_empty(db):
+    first = run(db.page_fruits("price", limit=1))[0]
+    assert first[4] is None
+    assert run(db.page_fruits("price", before=(first[4], first[0]), limit=5)) == []
+
+
+def test_next_crosses_from_null_to_priced_rows(db):
+    rows = run(db.page_fruits("price", limit=4))
+    assert [row[4] for row in rows] == [None] * 4
+    following = run(db.page_fruits("price", after=(rows[-1][4], rows[-1][0]), limit=1))
+    assert following[0][4] == 9000
+
+
+def test_search_is_combined_with_keyset(db):
+    # "trái" là từ loại bị bỏ khi chuẩn hoá, nên tìm theo số thứ tự
+    rows = run(db.page_fruits("price", search="1", limit=1))
+    following = run(db.page_fruits("price", search="1", after=(rows[-1][4], rows[-1][0]), limit=100))
+    ids = [row[0] for row in rows + following]
+    assert len(ids) == len(set(ids)) == run(db.count_fruits("1")) == 2
+
+
+def test_bot_page_state_round_trip(db, monkeypatch):
+    import telegram_image_bot as bot
+
+    monkeypatch.setattr(bot, "fruit_db", db)
+    monkeypatch.setattr(bot, "CATALOG_PAGE_SIZE", 4)
+    state = {"sort": "price", "search": None, "page": 1, "total": len(PRICES)}
+
+    pages = [run(bot._load_catalog_page(state))]
+    assert (state["has_prev"], state["has_next"]) == (False, True)
+    while state["has_next"]:
+        pages.append(run(bot._load_catalog_page(state, "next")))
+    assert state["page"] == 3
+    assert [row[0] for page in pages for row in page] == expected_order(db, "price")
+
+    assert run(bot._load_catalog_page(state, "prev")) == pages[1]
+    assert run(bot._load_catalog_page(state, "prev")) == pages[0]
+    assert (state["page"], state["has_prev"]) == (1, False)
@@ -0,0 +1,163 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+import fruit_db
+from fruit_db import MIGRATIONS, FruitDB
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+@pytest.fixture
+def db(tmp_path):
+    database = FruitDB(str(tmp_path / "fruits.db"))
+    run(database.migrate())
+    yield database
+    database.close()
+
+
+def make_legacy_db(path, names):
+    # Schema gốc của create_fruit_db.py, chưa có PRAGMA user_version
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE fruits (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT UNIQUE, price TEXT, description TEXT)")
+    conn.executemany("INSERT INTO fruits (name, price, description) VALUES (?, ?, '')", [(n, "25.000đ/kg") for n in names])
+    conn.commit()
+    conn.close()
+
+
+def test_migrate_fresh_database(db):
+    conn = sqlite3.connect(db.path)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == len(MIGRATIONS)
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    conn.close()
+    assert run(db.migrate()) == len(MIGRATIONS)
+
+
+def test_migrate_legacy_database(tmp_path):
+    path = str(tmp_path / "legacy.db")
+    make_legacy_db(path, ["chuối", "Quả Táo", "táo"])
+    database = FruitDB(path)
+    try:
+        run(database.migrate())
+        rows = sqlite3.connect(path).execute("SELECT name, name_norm, price_value FROM fruits ORDER BY id").fetchall()
+        # "táo" trùng tên chuẩn hoá với "Quả Táo": giữ dòng, không gán name_norm
+        assert rows == [("chuối", "chuối", 25000), ("Quả Táo", "táo", 25000), ("táo", None, 25000)]
+        assert run(database.get_fruit("trái táo"))[1] == "Quả Táo"
+    finally:
+        database.close()
+
+
+def test_failed_migration_rolls_back_schema_changes(tmp_path, monkeypatch):
+    path = str(tmp_path / "legacy.db")
+    make_legacy_db(path, ["chuối"])
+    sync = fruit_db._sync_name_norm
+
+    def broken_sync(conn):
+        raise RuntimeError("mất điện giữa chừng")
+
+    monkeypatch.setattr(fruit_db, "_sync_name_norm", broken_sync)
+    database = FruitDB(path)
+    try:
+        with pytest.raises(RuntimeError):
+            run(database.migrate())
+        conn = sqlite3.connect(path)
+        # Bước name_norm lỗi: ALTER TABLE được rollback cùng user_version
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == MIGRATIONS.index(fruit_db._migrate_name_norm)
+        assert "name_norm" not in [row[1] for row in conn.execute("PRAGMA table_info(fruits)")]
+        conn.close()
+        monkeypatch.setattr(fruit_db, "_sync_name_norm", sync)
+        assert run(database.migrate()) == len(MIGRATIONS)
+        assert run(database.get_fruit("chuối"))[1] == "chuối"
+    finally:
+        database.close()
+
+
+def test_plain_connection_can_write_after_migration(db):
+    conn = sqlite3.connect(db.path)
+    conn.execute("INSERT INTO fruits (name, price) VALUES ('mít', '30k')")
+    conn.commit()
+    conn.close()
+    # Lần migrate kế tiếp điền name_norm cho dòng ghi từ bên ngoài
+    run(db.migrate())
+    assert run(db.get_fruit("Mít"))[1] == "mít"
+
+
+def test_name_norm_is_unique(db):
+    assert run(db.add_fruit("chuối", "25k", "")) is not None
+    assert run(db.add_fruit("Quả Chuối!", "30k", "")) is None
+    assert run(db.seed([("CHUỐI", "1k", "")])) == 0
+
+
+def test_name_norm_resynced_when_normalization_changes(db, monkeypatch):
+    run(db.add_fruit("chuối già", "25k", ""))
+    monkeypatch.setattr(fruit_db, "normalize_name", lambda text, fold_diacritics=False: (text or "").upper())
+    run(db.migrate())
+    name_norm = sqlite3.connect(db.path).execute("SELECT name_norm FROM fruits").fetchone()[0]
+    assert name_norm == "CHUỐI GIÀ"
+
+
+def test_search_uses_stored_folded_name(db):
+    run(db.seed())
+    conn = sqlite3.connect(db.path)
+    conn.execute("INSERT INTO fruits (name, price) VALUES ('Dừa xiêm', '15k')")
+    conn.commit()
+    # Kết nối thường (không có hàm Python) đọc được name_fold; dòng ghi ngoài được điền ở lần migrate sau
+    run(db.migrate())
+    assert conn.execute("SELECT name_fold FROM fruits WHERE name='Dừa xiêm'").fetchone()[0] == "dua xiem"
+    conn.close()
+    rows = run(db.page_fruits("name", search="DUA", limit=10))
+    assert [row[1] for row in rows] == ["dưa hấu", "dứa", "Dừa xiêm"]
+    assert run(db.count_fruits("đưa")) == 3
+    assert run(db.count_fruits("50%")) == 0
+
+
+def test_delete_removes_aliases_and_references(db):
+    fruit_id = run(db.add_fruit("xoài", "40k", ""))[0]
+    run(db.add_alias("xoai cat", fruit_id))
+    run(db.add_reference(fruit_id, b"\x00" * 8, "admin"))
+    assert run(db.delete_fruit("Xoài")) == [fruit_id]
+    assert run(db.list_aliases()) == []
+    assert run(db.list_references()) == []
+
+
+@pytest.mark.parametrize("price, expected", [
+    ("25.000đ/kg", 25000),
+    ("120.000đ/kg", 120000),
+    ("1.000.000đ", 1000000),
+    ("25000", 25000),
+    ("25k", 25000),
+    ("25K/kg", 25000),
+    ("1.5k", 1500),
+    ("1,5k", 1500),
+    ("2,5 nghìn", 2500),
+    ("30 ngàn/kg", 30000),
+    ("1,2 triệu", 1200000),
+    ("2tr", 2000000),
+    ("500g: 20.000đ", 20000),
+    ("5kg giá 100.000 VNĐ", 100000),
+    ("Combo 3 100k", 100000),
+    ("45.000 đồng/kg", 45000),
+    ("liên hệ", None),
+    ("", None),
+    (None, None),
+])
+def test_parse_price(price, expected):
+    assert fruit_db.parse_price(price) == expected
+
+
+def test_migrate_reparses_stored_prices(tmp_path):
+    path = str(tmp_path / "legacy.db")
+    make_legacy_db(path, ["chuối"])
+    conn = sqlite3.connect(path)
+    conn.execute("UPDATE fruits SET price='1.5k'")
+    conn.commit()
+    conn.close()
+    database = FruitDB(path)
+    try:
+        run(database.migrate())
+    finally:
+        database.close()
+    assert sqlite3.connect(path).execute("SELECT price_value FROM fruits").fetchone()[0] == 1500
@@ -0,0 +1,62 @@
+import asyncio
+
+import pytest
+
+from gemini_batcher import GeminiBatcher
+from gemini_client import GeminiError
+
+
+class FakeGemini:
+    def __init__(self, batch_result=None, batch_error=None):
+        self.batch_result = batch_result
+        self.batch_error = batch_error
+        self.batches = []
+        self.singles = []
+
+    async def send_single(self, image, mime):
+        self.singles.append(image)
+        return f"single:{image.decode()}"
+
+    async def send_batch(self, items):
+        self.batches.append([image for image, _mime in items])
+        if self.batch_error:
+            raise self.batch_error
+        if self.batch_result == "echo":
+            return [f"batch:{image.decode()}" for image, _mime in items]
+        return self.batch_result
+
+
+def run_batch(fake, images, max_batch=4, max_wait=0.01):
+    async def scenario():
+        batcher = GeminiBatcher(fake.send_single, fake.send_batch, max_batch=max_batch, max_wait=max_wait)
+        results = await asyncio.gather(
+            *(batcher.submit(image, "image/jpeg") for image in images), return_exceptions=True
+        )
+        await batcher.aclose()
+        return results, batcher.stats()
+    return asyncio.run(scenario())
+
+
+def test_results_fan_out_in_order():
+    fake = FakeGemini(batch_result="echo")
+    results, stats = run_batch(fake, [b"a", b"b", b"c", b"d", b"e"])
+    assert results == ["batch:a", "batch:b", "batch:c", "batch:d", "single:e"]
+    assert fake.batches == [[b"a", b"b", b"c", b"d"]]
+    assert stats["batches"] == 1 and stats["single_calls"] == 1
+
+
+@pytest.mark.parametrize("batch_result", [None, ["only one"]])
+def test_unreadable_batch_falls_back_to_single_calls(batch_result):
+    fake = FakeGemini(batch_result=batch_result)
+    results, stats = run_batch(fake, [b"a", b"b"])
+    assert results == ["single:a", "single:b"]
+    assert stats["fallbacks"] == 1
+
+
+def test_batch_error_is_passed_to_every_image_without_fallback():
+    error = GeminiError("HTTP 429")
+    fake = FakeGemini(batch_error=error)
+    results, stats = run_batch(fake, [b"a", b"b", b"c"])
+    assert results == [error, error, error]
+    assert fake.singles == []
+    assert stats["errors"] == 1 and stats["fallbacks"] == 0
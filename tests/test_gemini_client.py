@@ -0,0 +1,155 @@
+import asyncio
+
+import httpx
+import pytest
+
+from gemini_client import GeminiClient, GeminiError
+
+
+def make_client(handler, **kwargs):
+    client = GeminiClient("key", "model", base_url="http://gemini.test/v1beta", backoff_base=0, **kwargs)
+    client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return client
+
+
+def test_retries_then_succeeds():
+    statuses = iter([503, 429, 200])
+
+    def handler(request):
+        status = next(statuses)
+        return httpx.Response(status, json={"ok": status == 200}, headers={"retry-after": "0"})
+
+    async def scenario():
+        client = make_client(handler, max_retries=3)
+        try:
+            return await client.generate_content({})
+        finally:
+            await client.aclose()
+
+    assert asyncio.run(scenario()) == {"ok": True}
+
+
+def test_gives_up_after_max_retries():
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(429, headers={"retry-after": "0"})
+
+    async def scenario():
+        client = make_client(handler, max_retries=2)
+        try:
+            await client.generate_content({})
+        finally:
+            await client.aclose()
+
+    with pytest.raises(GeminiError):
+        asyncio.run(scenario())
+    assert len(requests) == 3
+
+
+def test_rpm_is_charged_per_http_request():
+    statuses = iter([503, 200, 200])
+
+    def handler(request):
+        return httpx.Response(next(statuses), json={}, headers={"retry-after": "0"})
+
+    async def scenario():
+        # Bucket cố định 3 token, không hồi, để đếm đúng số request đã gửi
+        client = make_client(handler, max_retries=1, requests_per_minute=6)
+        client._rpm.rate = 0
+        client._rpm.capacity = client._rpm.tokens = 3
+        try:
+            await client.generate_content({})
+            await client.generate_content({})
+            return client._rpm.tokens
+        finally:
+            await client.aclose()
+
+    # 1 lần lỗi + 1 lần thành công + 1 request nữa = 3 token
+    assert asyncio.run(scenario()) == pytest.approx(0)
+
+
+def make_hedging_client(handler, **kwargs):
+    client = make_client(handler, max_retries=0, hedge_model="backup", hedge_min_samples=5, **kwargs)
+    client._latencies.extend([0.01] * 5)
+    return client
+
+
+def slow_primary_handler(requests, primary_delay=0.2):
+    async def handler(request):
+        model = "backup" if "backup" in request.url.path else "model"
+        requests.append(model)
+        if model == "model":
+            await asyncio.sleep(primary_delay)
+        return httpx.Response(200, json={"model": model})
+    return handler
+
+
+def test_latency_excludes_quota_wait():
+    def handler(request):
+        return httpx.Response(200, json={})
+
+    async def scenario():
+        client = make_client(handler, requests_per_minute=600)
+        client._rpm.tokens = 0  # chờ ~0.1s để có token
+        try:
+            started = asyncio.get_running_loop().time()
+            await client.generate_content({})
+            return asyncio.get_running_loop().time() - started, list(client._latencies)
+        finally:
+            await client.aclose()
+
+    elapsed, latencies = asyncio.run(scenario())
+    assert elapsed >= 0.05
+    assert len(latencies) == 1 and latencies[0] < 0.05
+
+
+def test_hedges_slow_primary():
+    requests = []
+
+    async def scenario():
+        client = make_hedging_client(slow_primary_handler(requests))
+        try:
+            return await client.generate_content({})
+        finally:
+            await client.aclose()
+
+    assert asyncio.run(scenario()) == {"model": "backup"}
+    assert requests == ["model", "backup"]
+
+
+def test_no_hedge_when_quota_is_exhausted():
+    requests = []
+
+    async def scenario():
+        client = make_hedging_client(slow_primary_handler(requests), requests_per_minute=60)
+        # Token tiếp theo có sau 0.05s, trước khi request chính (0.2s) xong
+        client._rpm.rate = 20
+        client._rpm.capacity = client._rpm.tokens = 1
+        try:
+            return await client.generate_content({})
+        finally:
+            await client.aclose()
+
+    assert asyncio.run(scenario()) == {"model": "model"}
+    assert requests == ["model"]
+
+
+def test_hedge_timer_starts_after_semaphore_wait():
+    requests = []
+
+    async def scenario():
+        client = make_hedging_client(slow_primary_handler(requests, primary_delay=0.001), max_concurrency=1)
+        try:
+            await client._semaphore.acquire()
+            call = asyncio.create_task(client.generate_content({}))
+            # Chờ slot lâu hơn ngưỡng hedge nhưng request chính chưa gửi: không được hedge
+            await asyncio.sleep(0.1)
+            client._semaphore.release()
+            return await call
+        finally:
+            await client.aclose()
+
+    assert asyncio.run(scenario()) == {"model": "model"}
+    assert requests == ["model"]
@@ -0,0 +1,149 @@
+import asyncio
+
+import pytest
+
+from job_scheduler import QueueFullError, RateLimitedError, RecognitionScheduler, TokenBucket
+
+
+def test_token_bucket_refills_over_time(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("job_scheduler.time.monotonic", lambda: now[0])
+    bucket = TokenBucket(rate_per_second=1, capacity=2)
+    assert bucket.try_acquire() and bucket.try_acquire()
+    assert not bucket.try_acquire()
+    assert bucket.time_until() == pytest.approx(1.0)
+    now[0] += 1.5
+    assert bucket.try_acquire()
+    assert not bucket.try_acquire()
+
+
+def test_round_robin_between_users():
+    async def scenario():
+        scheduler = RecognitionScheduler(max_concurrency=1, user_rate_per_minute=600, user_burst=10)
+        order = []
+
+        def job(tag):
+            async def run():
+                order.append(tag)
+            return run
+
+        futures = [scheduler.submit(1, job(f"a{i}")) for i in range(3)]
+        futures += [scheduler.submit(2, job(f"b{i}")) for i in range(2)]
+        futures.append(scheduler.submit(3, job("admin"), priority=True))
+        scheduler.start()
+        await asyncio.gather(*futures)
+        await scheduler.stop()
+        return order
+
+    assert asyncio.run(scenario()) == ["admin", "a0", "b0", "a1", "b1", "a2"]
+
+
+def test_album_weight_counts_per_image_in_round_robin():
+    async def scenario():
+        scheduler = RecognitionScheduler(max_concurrency=1, user_rate_per_minute=600, user_burst=10)
+        order = []
+
+        def job(tag):
+            async def run():
+                order.append(tag)
+            return run
+
+        futures = [scheduler.submit(1, job("album"), weight=3), scheduler.submit(1, job("a1"))]
+        futures += [scheduler.submit(2, job(f"b{i}")) for i in range(4)]
+        scheduler.start()
+        await asyncio.gather(*futures)
+        await scheduler.stop()
+        return order
+
+    # Album 3 ảnh chờ người kia chạy 2 ảnh lẻ trước, rồi mới đến lượt
+    assert asyncio.run(scenario()) == ["b0", "b1", "album", "b2", "a1", "b3"]
+
+
+def test_album_weight_is_charged_to_the_bucket():
+    async def scenario():
+        scheduler = RecognitionScheduler(user_rate_per_minute=1, user_burst=5)
+
+        async def noop():
+            return None
+
+        scheduler.submit(1, noop, weight=3)
+        with pytest.raises(RateLimitedError):
+            scheduler.submit(1, noop, weight=3)
+        scheduler.submit(1, noop, weight=2)
+        # Album lớn hơn burst: nhận khi bucket đầy, dùng hết bucket
+        scheduler.submit(2, noop, weight=10)
+        with pytest.raises(RateLimitedError):
+            scheduler.submit(2, noop)
+        stats = scheduler.stats()
+        await scheduler.stop()
+        return stats
+
+    stats = asyncio.run(scenario())
+    assert stats["submitted"] == 3 and stats["rejected_rate_limited"] == 2
+
+
+def test_admission_rejects_bursts_and_full_queue():
+    async def scenario():
+        scheduler = RecognitionScheduler(max_concurrency=1, user_rate_per_minute=1, user_burst=2, max_queue=3)
+
+        async def noop():
+            return None
+
+        scheduler.submit(1, noop)
+        scheduler.submit(1, noop)
+        with pytest.raises(RateLimitedError) as rate_limited:
+            scheduler.submit(1, noop)
+        assert rate_limited.value.retry_after > 0
+        scheduler.submit(2, noop)
+        with pytest.raises(QueueFullError):
+            scheduler.submit(3, noop)
+        # Admin vẫn bị giới hạn bởi độ dài hàng đợi
+        with pytest.raises(QueueFullError):
+            scheduler.submit(4, noop, priority=True)
+        stats = scheduler.stats()
+        await scheduler.stop()
+        return stats
+
+    stats = asyncio.run(scenario())
+    assert stats["submitted"] == 3
+    assert stats["rejected_rate_limited"] == 1
+    assert stats["rejected_queue_full"] == 2
+
+
+def test_failed_job_propagates_and_releases_slot():
+    async def scenario():
+        scheduler = RecognitionScheduler(max_concurrency=1)
+        scheduler.start()
+
+        async def boom():
+            raise ValueError("boom")
+
+        async def ok():
+            return 42
+
+        failed = scheduler.submit(1, boom)
+        succeeded = scheduler.submit(2, ok)
+        with pytest.raises(ValueError):
+            await failed
+        result = await succeeded
+        await scheduler.stop()
+        return result, scheduler.stats()
+
+    result, stats = asyncio.run(scenario())
+    assert result == 42
+    assert stats["failed"] == 1 and stats["completed"] == 1
+
+
+def test_stop_rejects_queued_jobs():
+    async def scenario():
+        scheduler = RecognitionScheduler()
+
+        async def noop():
+            return None
+
+        future = scheduler.submit(1, noop)
+        await scheduler.stop()
+        return future
+
+    future = asyncio.run(scenario())
+    assert isinstance(future.exception(), QueueFullError)
@@ -0,0 +1,41 @@
+import asyncio
+
+import pytest
+
+import telegram_image_bot as bot
+from fruit_db import DEFAULT_FRUITS
+
+
+@pytest.fixture
+def learned(monkeypatch):
+    bot.catalog_index.load(
+        [(i, name, price, desc) for i, (name, price, desc) in enumerate(DEFAULT_FRUITS, start=1)],
+        [("thơm", 7)],
+    )
+    calls = []
+
+    async def fake_add_reference_image(fruit_id, features, source, max_per_source=0):
+        calls.append((fruit_id, source))
+
+    monkeypatch.setattr(bot, "add_reference_image", fake_add_reference_image)
+    monkeypatch.setitem(bot.recognizer_counters, "learned", 0)
+    return calls
+
+
+@pytest.mark.parametrize("label, fruit_id", [("chuối", 1), ("quả xoài", 4), ("thơm", 7)])
+def test_exact_label_is_learned(learned, label, fruit_id):
+    assert asyncio.run(bot.learn_from_gemini(label, [0.0])) is True
+    assert learned == [(fruit_id, "gemini")]
+
+
+@pytest.mark.parametrize("label", ["chuoi", "thanh longg", "dừa", "chuối chín", "", None])
+def test_fuzzy_or_folded_label_is_not_learned(learned, label):
+    # lookup() vẫn có thể trả lời khách, nhưng không được thành ảnh tham chiếu
+    assert asyncio.run(bot.learn_from_gemini(label, [0.0])) is False
+    assert learned == []
+    assert bot.recognizer_counters["learned"] == 0
+
+
+def test_no_features_is_not_learned(learned):
+    assert asyncio.run(bot.learn_from_gemini("chuối", None)) is False
+    assert learned == []
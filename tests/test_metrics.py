@@ -0,0 +1,51 @@
+import asyncio
+
+import metrics
+
+
+def test_callback_counter_renders_as_counter():
+    registry = metrics.Registry()
+    registry.register(metrics.CallbackCounter("demo_hits_total", "Hits", lambda: 3))
+    registry.register(metrics.CallbackGauge("demo_depth", "Depth", lambda: 1))
+    text = registry.render()
+    assert "# TYPE demo_hits_total counter\ndemo_hits_total 3" in text
+    assert "# TYPE demo_depth gauge\ndemo_depth 1" in text
+
+
+def test_all_total_metrics_are_counters():
+    import telegram_image_bot as bot
+
+    bot.register_gauges()
+    for line in metrics.REGISTRY.render().splitlines():
+        if line.startswith("# TYPE ") and line.split()[2].endswith("_total"):
+            assert line.split()[3] == "counter", line
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = metrics.Histogram("demo_seconds", "Demo", ["stage"], buckets=(0.1, 1))
+    histogram.observe(0.05, stage="a")
+    histogram.observe(0.5, stage="a")
+    lines = histogram.collect()
+    assert 'demo_seconds_bucket{stage="a",le="0.1"} 1' in lines
+    assert 'demo_seconds_bucket{stage="a",le="1"} 2' in lines
+    assert 'demo_seconds_bucket{stage="a",le="+Inf"} 2' in lines
+
+
+def test_default_port_is_not_prometheus_port():
+    import telegram_image_bot as bot
+
+    assert bot.METRICS_PORT != 9090
+
+
+def test_metrics_endpoint_serves_registry():
+    async def scenario():
+        server = await metrics.start_http_server("127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"GET /metrics HTTP/1.1\r\nHost: x\r\n\r\n")
+        body = await reader.read()
+        writer.close()
+        server.close()
+        return body
+
+    assert b"200 OK" in asyncio.run(scenario())
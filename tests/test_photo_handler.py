@@ -0,0 +1,81 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import telegram_image_bot as bot
+from fruit_db import DEFAULT_FRUITS
+from gemini_client import GeminiError
+from job_scheduler import RecognitionScheduler
+
+
+class FakeMessage:
+    def __init__(self, message_id, media_group_id=None):
+        self.message_id = message_id
+        self.chat_id = 1
+        self.media_group_id = media_group_id
+        self.photo = None
+        self.document = SimpleNamespace(file_id=f"img{message_id}", file_unique_id=f"u{message_id}",
+                                        mime_type="image/jpeg", file_size=1000)
+        self.replies = []
+
+    async def reply_text(self, text, **kwargs):
+        status = SimpleNamespace(texts=[text])
+
+        async def edit_text(new_text, **kwargs):
+            status.texts.append(new_text)
+
+        status.edit_text = edit_text
+        self.replies.append(status)
+        return status
+
+
+@pytest.fixture(autouse=True)
+def catalog():
+    bot.catalog_index.load([(i, name, price, desc) for i, (name, price, desc) in enumerate(DEFAULT_FRUITS, start=1)])
+
+
+def handle(messages, monkeypatch, recognize):
+    monkeypatch.setattr(bot, "recognize_image", recognize)
+    monkeypatch.setattr(bot, "ALBUM_WAIT_SECONDS", 0.01)
+
+    async def scenario():
+        monkeypatch.setattr(bot, "recognition_scheduler", RecognitionScheduler())
+        bot.recognition_scheduler.start()
+        try:
+            updates = [SimpleNamespace(update_id=m.message_id, message=m, effective_user=SimpleNamespace(id=42))
+                       for m in messages]
+            await asyncio.gather(*(bot.handle_photo(update, SimpleNamespace(bot=None)) for update in updates))
+        finally:
+            await bot.recognition_scheduler.stop()
+    asyncio.run(scenario())
+    return [status.texts[-1] for message in messages for status in message.replies]
+
+
+def test_batch_error_is_reported_as_unrecognized(monkeypatch):
+    class FailingBatcher:
+        async def submit(self, image_bytes, mime_type):
+            raise GeminiError("HTTP 500")
+
+    monkeypatch.setattr(bot, "gemini_batcher", FailingBatcher())
+    assert asyncio.run(bot.recognize_with_gemini(b"img", "image/jpeg")) is None
+
+
+def test_one_failed_image_keeps_the_rest_of_the_album(monkeypatch):
+    async def recognize(_bot, source):
+        if source[0] == "img2":
+            raise RuntimeError("download failed")
+        return {"img1": "chuối", "img3": None}[source[0]]
+
+    messages = [FakeMessage(i, media_group_id="album") for i in (1, 2, 3)]
+    [reply] = handle(messages, monkeypatch, recognize)
+    assert "*Ảnh 1:*\n🍉 **Kết quả:** *Chuối*" in reply
+    assert "*Ảnh 2:*\n❌ Không thể tải ảnh hoặc xử lý." in reply
+    assert "*Ảnh 3:*\n⚠️ Không thể nhận diện" in reply
+
+
+def test_single_photo_failure(monkeypatch):
+    async def recognize(_bot, source):
+        raise RuntimeError("download failed")
+
+    assert handle([FakeMessage(1)], monkeypatch, recognize) == ["❌ Không thể tải ảnh hoặc xử lý."]